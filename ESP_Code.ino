@@ -17,8 +17,18 @@
 #define TRIG4_PIN  16
 #define ECHO4_PIN  4
 
+// Binary plan frame from Python (see serial_protocol.py):
+// 0xA5 | version | payload length | seq, n, order[n], durations[n] (uint16 BE) | CRC-16 CCITT (BE)
+#define FRAME_START 0xA5
+#define PROTOCOL_VERSION 1
+#define MAX_PAYLOAD 32
+
 int counter = 0;
 
+bool planReceived = false;  // set when a valid plan arrives, ends the wait window early
+bool acceptingPlan = false;  // only inside the Ready window or the post-emergency replan window
+const unsigned long planTimeout = 5000;  // fallback if no plan arrives
+
 const int yellowDuration = 2;
 
 const int ldrThreshold = 100;  // Adjust this based on your environment
@@ -26,6 +36,19 @@ const int ldrThreshold = 100;  // Adjust this based on your environment
 bool emergencyTriggered = false;
 int emergencyLane = -1;
 const int emergencyDuration = 10;
+const unsigned long replanTimeout = 1000;  // wait for Python's remaining-lanes plan after an emergency
+
+// Set by the IR interrupts, so an emergency is seen within a few ms even in the middle of a phase
+volatile int irLane = -1;
+volatile unsigned long irMillis = 0;
+int currentPhase = 4;            // index in laneOrder being run, 4 = between cycles; sent with "Emerg"
+bool emergencyReported = false;  // "Emerg" already pushed for the pending emergency
+int lastAcceptedSeq = -1;        // seq and CRC of the last applied plan, a retransmit of it is Acked again
+uint16_t lastAcceptedCrc = 0;
+
+// Defined below loop(); the Arduino builder does not generate prototypes for default arguments
+bool waitPhase(unsigned long ms, bool interruptible = true);
+bool handleSingleLane(int laneIndex, int duration, bool interruptible = true);
 
 int ledState[16] = {0}; // LED states: 0 = OFF, 1 = ON
 
@@ -59,39 +82,90 @@ void setup() {
   pinMode(TRIG4_PIN, OUTPUT);
   pinMode(ECHO4_PIN, INPUT);
 
+  attachInterrupt(digitalPinToInterrupt(IR1_PIN), ir1Isr, RISING);
+  attachInterrupt(digitalPinToInterrupt(IR2_PIN), ir2Isr, RISING);
+  attachInterrupt(digitalPinToInterrupt(IR3_PIN), ir3Isr, RISING);
+  attachInterrupt(digitalPinToInterrupt(IR4_PIN), ir4Isr, RISING);
+
   Serial.begin(9600);
+  Serial.setTimeout(100);  // bound readBytes() while receiving a frame
+}
+
+void IRAM_ATTR flagEmergency(int lane) {
+  if (irLane < 0) {
+    irLane = lane;
+    irMillis = millis();
+  }
 }
 
+void IRAM_ATTR ir1Isr() { flagEmergency(0); }
+void IRAM_ATTR ir2Isr() { flagEmergency(1); }
+void IRAM_ATTR ir3Isr() { flagEmergency(2); }
+void IRAM_ATTR ir4Isr() { flagEmergency(3); }
+
 void loop() {
+  planReceived = false;
+  acceptingPlan = true;  // before "Ready", a fast reply must not be refused
   Serial.println("Ready");
 
   delay(100); // Let Python catch the "Ready" line
 
   readAllUltrasonics(); // Send ultrasonic data immediately after "Ready"
 
-  // Wait up to 5 seconds for serial input
+  // Wait for a plan, up to planTimeout as a fallback
   unsigned long startTime = millis();
-  while (millis() - startTime < 5000) {
+  while (!planReceived && millis() - startTime < planTimeout) {
     checkSerialInput();
-    delay(10);  // brief delay to avoid hogging CPU
+    delay(1);  // brief delay to avoid hogging CPU
   } 
+  acceptingPlan = false;  // a late plan must not reorder lanes while they run
 
   ldrLoop();
 
   // Process the traffic lights only if data has been received
+  bool replanned = false;
   for (int i = 0; i < 4; i++) {
+    currentPhase = i;
     ldrLoop();
 
-    if (handleEmergencyIfDetected()) {
-      // Emergency handled → exit this cycle and restart
+    if (handleEmergencyIfDetected(true)) {
+      // Emergency handled → run the replanned remaining lanes, or exit this cycle and restart
+      if (planReceived) { replanned = true; i = -1; continue; }
       break;
     }
 
     int laneIndex = laneOrder[i];
     int duration = laneTimes[laneIndex];
-    handleSingleLane(laneIndex, duration);
+    if (replanned && duration <= 0) continue;  // lane already served before the emergency
+
+    if (!handleSingleLane(laneIndex, duration)) {
+      // IR interrupt during the phase
+      handleEmergencyIfDetected(false);
+      if (planReceived) { replanned = true; i = -1; continue; }
+      break;
+    }
+  }
+  currentPhase = 4;
+  if (!waitPhase(10000)) {
+    handleEmergencyIfDetected(false);  // between cycles, every lane has been served
   }
-  delay(10000);
+}
+
+// delay() that keeps reading plan frames and, if interruptible, ends early on an IR interrupt.
+// Returns false if an emergency is pending.
+bool waitPhase(unsigned long ms, bool interruptible) {
+  unsigned long start = millis();
+  while (millis() - start < ms) {
+    if (irLane >= 0 && interruptible) {
+      if (!emergencyReported) {
+        reportEmergency(irLane, irMillis);  // before the yellow, Python replans meanwhile
+      }
+      return false;
+    }
+    checkSerialInput();
+    delay(10);
+  }
+  return true;
 }
 
 // Turn off all lights
@@ -112,8 +186,8 @@ void shiftOutData() {
   digitalWrite(LATCH_PIN, HIGH);
 }
 
-// For handling current traffic light
-void handleSingleLane(int laneIndex, int duration) {
+// For handling current traffic light, false if an emergency cut it short
+bool handleSingleLane(int laneIndex, int duration, bool interruptible) {
   char laneLabel = '1' + laneIndex;
 
   // Turn on green for current lane
@@ -126,13 +200,14 @@ void handleSingleLane(int laneIndex, int duration) {
   }
 
   shiftOutData();
-  delay(duration * 1000);  // Green light for (duration - 5) seconds
+  bool completed = waitPhase(duration * 1000UL, interruptible);  // Green light for (duration - 5) seconds
 
-  // Switch to yellow
+  // Switch to yellow, also before handing over to an emergency vehicle
   ledState[greenLEDs[laneIndex]] = 0;
   ledState[yellowLEDs[laneIndex]] = 1;
   shiftOutData();
-  delay(yellowDuration * 1000);  // Yellow light for 5 seconds
+  waitPhase(yellowDuration * 1000UL, false);  // Yellow light for 5 seconds, never cut short
+  return completed;
 }
 
 int getStableLDRReading(int pin, int samples = 10) {
@@ -156,22 +231,57 @@ void ldrLoop() {
   delay(500);
 }
 
-bool handleEmergencyIfDetected() {
+// Tell Python right away: Emerg,<lane 0-3>,<phase>,<ms since the IR edge>
+void reportEmergency(int lane, unsigned long detectedAt) {
+  Serial.print("Emerg,");
+  Serial.print(lane);
+  Serial.print(",");
+  Serial.print(currentPhase);
+  Serial.print(",");
+  Serial.println(millis() - detectedAt);
+  emergencyReported = true;
+  planReceived = false;  // Python answers with a plan for the remaining lanes
+  acceptingPlan = currentPhase < 4;  // between cycles there is nothing left to replan
+}
+
+// poll = also read the IR pins, for a vehicle that was already there before the interrupt edge.
+bool handleEmergencyIfDetected(bool poll) {
+  noInterrupts();
+  emergencyLane = irLane;
+  unsigned long detectedAt = irMillis;
+  irLane = -1;
+  interrupts();
+
   // Detect which IR sensor is LOW
-  if (digitalRead(IR1_PIN) == HIGH) {
-    emergencyLane = 0;
-  } else if (digitalRead(IR2_PIN) == HIGH) {
-    emergencyLane = 1;
-  } else if (digitalRead(IR3_PIN) == HIGH) {
-    emergencyLane = 2;
-  } else if (digitalRead(IR4_PIN) == HIGH) {
-    emergencyLane = 3;
-  } else {
-    emergencyLane = -1;
+  if (emergencyLane == -1 && poll) {
+    detectedAt = millis();
+    if (digitalRead(IR1_PIN) == HIGH) {
+      emergencyLane = 0;
+    } else if (digitalRead(IR2_PIN) == HIGH) {
+      emergencyLane = 1;
+    } else if (digitalRead(IR3_PIN) == HIGH) {
+      emergencyLane = 2;
+    } else if (digitalRead(IR4_PIN) == HIGH) {
+      emergencyLane = 3;
+    }
   }
 
   if (emergencyLane != -1) {
-    handleSingleLane(emergencyLane, emergencyDuration);
+    if (!emergencyReported) {
+      reportEmergency(emergencyLane, detectedAt);
+    }
+
+    emergencyReported = false;  // a second vehicle during this green gets its own turn
+    handleSingleLane(emergencyLane, emergencyDuration, false);  // never cut short, a new edge is handled after it
+    Serial.print("EmergEnd,");
+    Serial.println(emergencyLane);
+
+    unsigned long startTime = millis();
+    while (!planReceived && currentPhase < 4 && millis() - startTime < replanTimeout) {
+      checkSerialInput();
+      delay(1);
+    }
+    acceptingPlan = false;
 
     emergencyLane = -1; // Reset
     return true;        // Signal that emergency occurred
@@ -217,10 +327,99 @@ void readAllUltrasonics() {
   delay(500);
 }
 
+uint16_t crc16Ccitt(const uint8_t *data, size_t len) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int b = 0; b < 8; b++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+void sendNack(int seq, const char *reason) {
+  Serial.print("Nack,");
+  Serial.print(seq);
+  Serial.print(",");
+  Serial.println(reason);
+}
+
+// Called after the FRAME_START byte has been consumed
+void readPlanFrame() {
+  uint8_t buf[2 + MAX_PAYLOAD + 2];  // version, length, payload, crc
+
+  if (Serial.readBytes(buf, 2) != 2) {
+    sendNack(-1, "timeout");
+    return;
+  }
+  uint8_t length = buf[1];
+  if (buf[0] != PROTOCOL_VERSION || length < 2 || length > MAX_PAYLOAD) {
+    sendNack(-1, "header");
+    return;
+  }
+  if (Serial.readBytes(buf + 2, length + 2) != length + 2) {
+    sendNack(-1, "timeout");
+    return;
+  }
+
+  uint8_t *payload = buf + 2;
+  int seq = payload[0];
+  uint16_t crc = ((uint16_t)buf[2 + length] << 8) | buf[3 + length];
+  if (crc16Ccitt(buf, 2 + length) != crc) {
+    sendNack(seq, "crc");
+    return;
+  }
+
+  int n = payload[1];
+  if (n != 4 || length != 2 + 3 * n) {
+    sendNack(seq, "lanes");
+    return;
+  }
+  for (int i = 0; i < n; i++) {
+    if (payload[2 + i] >= 4) {
+      sendNack(seq, "order");
+      return;
+    }
+  }
+
+  if (seq == lastAcceptedSeq && crc == lastAcceptedCrc) {
+    // retransmit after a lost Ack, the plan is already applied
+    Serial.print("Ack,");
+    Serial.println(seq);
+    return;
+  }
+  if (!acceptingPlan) {
+    // late cycle plan: the lanes are running, keep the current plan
+    sendNack(seq, "busy");
+    return;
+  }
+
+  for (int i = 0; i < n; i++) {
+    laneOrder[i] = payload[2 + i];
+    laneTimes[i] = ((int)payload[2 + n + 2 * i] << 8) | payload[3 + n + 2 * i];
+  }
+  planReceived = true;
+  acceptingPlan = false;  // one plan per window
+  lastAcceptedSeq = seq;
+  lastAcceptedCrc = crc;
+
+  Serial.print("Ack,");
+  Serial.println(seq);
+}
+
 void checkSerialInput() {
+  if (Serial.available() && Serial.peek() == FRAME_START) {
+    Serial.read();  // consume start byte
+    readPlanFrame();
+    return;
+  }
+
+  // Legacy text format
   if (Serial.available()) {
     String input = Serial.readStringUntil('\n');
     input.trim();
+    if (!acceptingPlan) return;  // no reply channel in the legacy format, drop it
 
     if (input.startsWith("Times,")) {
       // Expected format: Times,10,12,9,11
@@ -242,6 +441,8 @@ void checkSerialInput() {
         laneOrder[index++] = val.toInt();
         input = (commaIndex != -1) ? input.substring(commaIndex + 1) : "";
       }
+      planReceived = true;  // legacy senders write Order after Times
+      acceptingPlan = false;
     }
   }
 }
@@ -1,10 +1,37 @@
-from ultralytics import YOLO
 import cv2
 import numpy as np
 import requests
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from frame_grabber import FrameGrabber
+from motion_gate import MotionGate
+from inference_governor import InferenceGovernor
+from tracker import LaneTracker
+from lane_config import LANES_FILE, get_store
+from preprocess import Letterboxer
+from detector_backends import load_detector
+import metrics
 
-model = YOLO("best.pt")  # Load YOLOv8 model
+MODEL_WEIGHTS = "best.pt"
+CONTROLLER_LANES = 4  # the ESP32 and the decision scripts drive exactly 4 lanes
+model = None  # YOLOv8 model, loaded on first use or by warm_up(), see get_model()
+model_ready = threading.Event()  # set once the detector has finished an inference
+_model_lock = threading.Lock()
+_inference_lock = threading.Lock()  # the tracking thread and main() may share the model
+grabber = None  # background FrameGrabber used by main()
+headless = False  # True -> never call results[0].show()
+snapshot_sink = None  # optional SnapshotSink for annotated frames
+motion_gate = None  # optional MotionGate, see enable_motion_gate()
+roi_inference = False  # True -> infer only on the lane bounding rectangle
+recorder = None  # optional recorder.Recorder, stores every JPEG used for a decision
+governor = None  # optional InferenceGovernor, see enable_governor()
+min_confidence = 0.0  # boxes below this confidence are dropped by extract_boxes
+class_filter = None  # None -> keep every class, else a set of class ids to keep
+class_weights = None  # None -> every box counts 1, else {class id: weight}, e.g. {5: 2.5} for buses
+tracker = None  # LaneTracker fed between cycles, see enable_tracking()
+tracking_options = None  # set by enable_tracking(), the tracker starts with the grabber in main()
 
 def resize_image(image, target_size=(640, 640), color=(0,0,0)):
     """
@@ -30,62 +57,195 @@ def resize_image(image, target_size=(640, 640), color=(0,0,0)):
     padded = cv2.copyMakeBorder(resized, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
     return padded
 
+_letterboxers = {}  # one reusable decode/letterbox buffer set per camera url
+
+@metrics.timed("capture", "Time to fetch and decode one camera frame inside a cycle")
 def capture_frame(ip, port):
   url=f'http://{ip}:{port}/shot.jpg'  #construct url for webcam stream
   try:
     response = requests.get(url, timeout=10) #http GET request for jpg img
     if response.status_code == 200: #success
 
-      #response.content -> raw byte data
-      #uint8 -> unsigned 8-bit ints -> (0,255) -> standard for greycale/rgb
-      img_arr = np.asarray(bytearray(response.content), np.uint8)
+      if recorder is not None:
+        recorder.record_frame(response.content)
 
-      frame = cv2.imdecode(img_arr, cv2.IMREAD_COLOR) #decode image in color
-      frame = resize_image(frame)
+      #response.content -> raw byte data, decoded and letterboxed in one step
+      letterboxer = _letterboxers.get(url)
+      if letterboxer is None:
+        letterboxer = _letterboxers[url] = Letterboxer()
+      frame, layout = letterboxer.decode(response.content)
+      if frame is None:
+        print("failed to decode img")
+        metrics.inc("capture_failures_total")
       
       return frame 
 
     else:
       print(f"failed to fetch img -> status code = {response.status_code}")
+      metrics.inc("capture_failures_total")
       return None
   
   except requests.exceptions.RequestException as e:
         print(f"Exception occured\n{e}")
+        metrics.inc("capture_failures_total")
         return None
 
-def detect_cars(frame):
+def get_model():
+  """
+  The detector, loading it (and torch / ultralytics) on the first call.
+  """
+  global model
+  if model is None:
+    with _model_lock:
+      if model is None:
+        from ultralytics import YOLO #heavy import, kept out of module import time
+        print(f"Loading detector {MODEL_WEIGHTS}...")
+        model = YOLO(MODEL_WEIGHTS)
+  return model
+
+def warm_up(background=True, size=(640, 640)):
+  """
+  Load the detector and run one inference on a blank frame so the first real
+  frame does not pay for it. Until detector_ready() the controllers run on
+  fixed-time counts and the ultrasonic sensors.
+  """
+  def run():
+    started = time.perf_counter()
+    try:
+      get_model()(np.zeros((size[1], size[0], 3), dtype=np.uint8), verbose=False)
+    except Exception as e:
+      print(f"Detector warmup failed\n{e}")
+      return
+    model_ready.set()
+    seconds = time.perf_counter() - started
+    print(f"Detector ready after {seconds:.1f} s")
+    metrics.log_event("detector_ready", seconds=round(seconds, 2))
+
+  if not background:
+    run()
+    return None
+  thread = threading.Thread(target=run, daemon=True, name="detector-warmup")
+  thread.start()
+  return thread
+
+def detector_ready():
+  return model_ready.is_set()
+
+@metrics.timed("inference", "Time for one model call")
+def detect_cars(frame, imgsz=None):
   if frame is None:
         print("no frame to run inference on")
         return None
   try:
-    results = model(frame) #pass frame to yolo model for inference 
+    active_model = get_model()
+    if governor is not None: #input size / weights chosen by the deadline governor
+      active_model = governor.model_for_level(active_model)
+      if imgsz is None:
+        imgsz = governor.imgsz
+    with _inference_lock:
+      if imgsz is None:
+        results = active_model(frame) #pass frame to yolo model for inference 
+      else:
+        results = active_model(frame, imgsz=imgsz) #input size fitted to a cropped frame
   except Exception as e:
         print(f"Exception occurred during inference\n{e}")
         return None
+  model_ready.set()
   if results[0] is not None:
-      results[0].show()  
+      publish_result(results[0])
   return results[0]
 
-def extract_boxes(result):
-  boxes = []  
+def set_detector_backend(backend="pytorch", weights="best.pt", int8=False, calib_dir=None):
+    """
+    Swap the detector used by detect_cars, e.g. to an ONNX or OpenVINO export for CPU-only boxes.
+    The export is done once and reused on later startups.
+    """
+    global model
+    with _model_lock:
+        model = load_detector(backend, weights, int8=int8, calib_dir=calib_dir)
+    return model
+
+def set_headless(enabled=True, sink=None):
+    """
+    Headless mode never opens an image viewer.
+    sink -> optional SnapshotSink that receives annotated results asynchronously.
+    """
+    global headless, snapshot_sink
+    headless = enabled
+    snapshot_sink = sink
+
+def publish_result(result):
+  if snapshot_sink is not None:
+      snapshot_sink.submit(result) #non-blocking, drops when the writer is behind
+  if not headless:
+      result.show()
+
+class Detections:
+  """
+  Boxes of one result as columns: centers and sizes (N, 2), confidences (N,)
+  and class ids (N,), all NumPy arrays in frame pixels.
+  """
+
+  def __init__(self, centers, sizes, confidences, classes):
+    self.centers = centers
+    self.sizes = sizes
+    self.confidences = confidences
+    self.classes = classes
+
+  def __len__(self):
+    return len(self.centers)
 
+  def select(self, keep):
+    return Detections(self.centers[keep], self.sizes[keep], self.confidences[keep], self.classes[keep])
+
+  def offset(self, dx, dy):
+    return Detections(self.centers + np.array([dx, dy], dtype=self.centers.dtype), self.sizes,
+                      self.confidences, self.classes)
+
+  def weights(self, class_weights):
+    """
+    Weight of each box looked up from {class id: weight}, 1 for unlisted classes.
+    """
+    if not class_weights or len(self) == 0:
+      return np.ones(len(self), dtype=np.float32)
+    lut = np.ones(max(int(self.classes.max()), max(class_weights)) + 1, dtype=np.float32)
+    for cls, weight in class_weights.items():
+      lut[cls] = weight
+    return lut[self.classes]
+
+def extract_boxes(result, min_conf=None, classes=None):
   if not hasattr(result, 'boxes'): 
         print("problem inference")
         return None
 
-  if len(result.boxes)==0:
+  data = result.boxes.data #x1, y1, x2, y2, [track id,] conf, cls
+  if hasattr(data, 'cpu'):
+      data = data.cpu().numpy() #one device to host copy for all boxes
+  data = np.asarray(data, dtype=np.float32)
+  if data.ndim != 2 or data.shape[0] == 0:
       print("no boxes in image")
       return None
 
-  #get center coordinates of cars (boxes)
-  for box in result.boxes:
-    try:
-      cx, cy, w, h = box.xywh[0] 
-      boxes.append((cx.item(), cy.item()))  #convert tensor elements to float
-    except (IndexError,ValueError, AttributeError, TypeError) as e:
-            print(f"box skipped -> exception occurred\n{e}")
-  
-  return boxes
+  xyxy = data[:, :4]
+  boxes = Detections((xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2],
+                     data[:, -2], data[:, -1].astype(np.intp))
+
+  min_conf = min_confidence if min_conf is None else min_conf
+  classes = class_filter if classes is None else classes
+  keep = boxes.confidences >= min_conf
+  if classes is not None:
+      keep &= np.isin(boxes.classes, list(classes))
+  return boxes.select(keep)
+
+def set_box_filter(min_conf=0.0, classes=None, weights=None):
+  """
+  Confidence threshold, kept class ids and per-class weights used by
+  extract_boxes / get_lane_counts when no explicit values are passed.
+  """
+  global min_confidence, class_filter, class_weights
+  min_confidence = min_conf
+  class_filter = set(classes) if classes is not None else None
+  class_weights = dict(weights) if weights else None
 
 def define_lanes_interactively(image_path): #interactive tool to define lane boundaries
     current_lane = []
@@ -141,33 +301,332 @@ def define_lanes_interactively(image_path): #interactive tool to define lane bou
     
     return lanes_polygons
 
-def get_lane_counts(boxes,lanes): 
-    lane_counts = [0, 0, 0, 0]
-    for cx, cy in boxes:
-        for i, lane in enumerate(lanes): 
-            if cv2.pointPolygonTest(lane, (cx, cy), False) >= 0: #check if center coordinates of the box lie in the lane
-                lane_counts[i] += 1
-                break
-    return lane_counts
+_lane_mask_cache = {}  # lane fingerprint -> label mask, one entry per lane definition in use
+_lane_roi_cache = {}
+_lane_edge_cache = {}
+_LANE_CACHE_SIZE = 32
+
+def _cached(cache, key, build):
+    value = cache.get(key)
+    if value is None:
+        if len(cache) >= _LANE_CACHE_SIZE:
+            cache.pop(next(iter(cache))) #drop the oldest definition
+        value = cache[key] = build()
+    return value
+
+def _lanes_key(lanes, size):
+    #cheap fingerprint of the lane definition, the mask is rebuilt only when it changes
+    polys = [np.asarray(lane, dtype=np.int32) for lane in lanes]
+    return (size, tuple(p.tobytes() for p in polys))
+
+def build_lane_mask(lanes, size=(640, 640)):
+    """
+    Rasterize lane polygons into a label image.
+    Each pixel holds lane index + 1, 0 means no lane.
+    """
+    w, h = size
+    dtype = np.uint8 if len(lanes) < 255 else np.uint16
+    mask = np.zeros((h, w), dtype=dtype)
+    #draw in reverse so the lowest lane index wins where polygons overlap
+    for i in reversed(range(len(lanes))):
+        pts = np.asarray(lanes[i], dtype=np.int32).reshape((-1, 1, 2))
+        cv2.fillPoly(mask, [pts], i + 1)
+        cv2.polylines(mask, [pts], True, i + 1, 1) #edges count as inside, like pointPolygonTest >= 0
+    return mask
+
+def get_lane_roi(lanes, size=(640, 640), margin=16, stride=32):
+    """
+    Union bounding rectangle (x0, y0, x1, y1) of all lane polygons, with a margin
+    so boxes straddling a lane edge are still seen. Width and height are rounded
+    up to the model stride so the crop can be inferred at its own size.
+    """
+    return _cached(_lane_roi_cache, _lanes_key(lanes, size) + (margin, stride),
+                   lambda: _build_lane_roi(lanes, size, margin, stride))
+
+def _build_lane_roi(lanes, size, margin, stride):
+    w, h = size
+    points = np.concatenate([np.asarray(lane, dtype=np.int32).reshape(-1, 2) for lane in lanes])
+    x, y, bw, bh = cv2.boundingRect(points)
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(w, x + bw + margin), min(h, y + bh + margin)
+
+    # round up to a stride multiple, growing towards whichever side has room
+    crop_w = min(w, -(-(x1 - x0) // stride) * stride)
+    crop_h = min(h, -(-(y1 - y0) // stride) * stride)
+    x0 = max(0, min(x0, w - crop_w))
+    y0 = max(0, min(y0, h - crop_h))
+    return (x0, y0, x0 + crop_w, y0 + crop_h)
+
+def enable_roi_inference(enabled=True):
+    """
+    Run the model only on the lane bounding rectangle instead of the full 640x640 frame.
+    Needs a detector that accepts a variable input size (PyTorch or a dynamic export).
+    """
+    global roi_inference
+    roi_inference = enabled
+
+def inference_roi(lanes, size=(640, 640)):
+    """
+    The crop detect_lane_boxes infers on, None when it runs on the full frame.
+    """
+    if not roi_inference or lanes is None or len(lanes) == 0:
+        return None
+    return get_lane_roi(lanes, size)
+
+def detect_lane_boxes(frame, lanes):
+    """
+    Detect cars and return box centers in full frame coordinates,
+    cropping to the lane region first when ROI inference is enabled.
+    """
+    if roi_inference and frame is not None and lanes is not None and len(lanes) > 0:
+        x0, y0, x1, y1 = get_lane_roi(lanes, (frame.shape[1], frame.shape[0]))
+        imgsz = (y1 - y0, x1 - x0)
+        if governor is not None and governor.imgsz: #shrink the crop input like the full frame one
+            scale = governor.imgsz / max(frame.shape[:2])
+            imgsz = tuple(max(32, int(round(side * scale / 32)) * 32) for side in imgsz)
+        result = detect_cars(frame[y0:y1, x0:x1], imgsz=imgsz)
+        boxes = extract_boxes(result)
+        if boxes:
+            boxes = boxes.offset(x0, y0) #back to frame coordinates
+        return result, boxes
 
-def process_frame(ip, port, lanes=None):
-    frame = capture_frame(ip, port)
     result = detect_cars(frame)
-    boxes = extract_boxes(result)
+    return result, extract_boxes(result)
+
+def get_lane_mask(lanes, size=(640, 640)):
+    return _cached(_lane_mask_cache, _lanes_key(lanes, size), lambda: build_lane_mask(lanes, size))
+
+def get_lane_edges(lanes, size=(640, 640), radius=2):
+    """
+    True where the label changes within `radius` pixels. Rasterized edges can be
+    a pixel off, so centers there are checked against the polygons exactly.
+    """
+    def build():
+        mask = get_lane_mask(lanes, size)
+        kernel = np.ones((2 * radius + 1, 2 * radius + 1), dtype=np.uint8)
+        return cv2.dilate(mask, kernel) != cv2.erode(mask, kernel)
+    return _cached(_lane_edge_cache, _lanes_key(lanes, size) + (radius,), build)
+
+def lane_labels(centers, lanes, size=(640, 640)):
+    """
+    Lane index + 1 per (cx, cy) center, 0 outside every lane; the lowest lane
+    index wins where lanes overlap and edges count as inside, like pointPolygonTest >= 0.
+    """
+    mask = get_lane_mask(lanes, size)
+    edges = get_lane_edges(lanes, size)
+    h, w = mask.shape
+    xs = np.floor(centers[:, 0] + 0.5).astype(np.intp)
+    ys = np.floor(centers[:, 1] + 0.5).astype(np.intp)
+    inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+
+    labels = np.zeros(len(centers), dtype=np.intp)
+    labels[inside] = mask[ys[inside], xs[inside]] #one gather for all box centers
+    exact = ~inside
+    exact[inside] = edges[ys[inside], xs[inside]]
+    if exact.any(): #few centers sit on an edge band or past the frame border
+        polys = [np.asarray(lane, dtype=np.float32).reshape((-1, 1, 2)) for lane in lanes]
+        for j in np.flatnonzero(exact):
+            point = (float(centers[j, 0]), float(centers[j, 1]))
+            labels[j] = next((i + 1 for i, poly in enumerate(polys) if cv2.pointPolygonTest(poly, point, False) >= 0), 0)
+    return labels
+
+@metrics.timed("lane_assignment", "Time to assign box centers to lanes")
+def get_lane_counts(boxes, lanes, weights=None):
+    """
+    Cars per lane. boxes is a Detections or a list of (cx, cy) centers;
+    with per-class weights (default class_weights) each box counts its
+    class weight and the lane totals are rounded to whole cars.
+    """
+    num_lanes = len(lanes) if lanes is not None else 0
+    if boxes is None or len(boxes) == 0 or num_lanes == 0:
+        return [0] * num_lanes
+
+    weights = class_weights if weights is None else weights
+    if isinstance(boxes, Detections):
+        centers = boxes.centers
+        box_weights = boxes.weights(weights) if weights else None
+    else:
+        centers = np.asarray(boxes, dtype=np.float32).reshape(-1, 2)
+        box_weights = None
+
+    labels = lane_labels(centers, lanes)
+    if box_weights is None:
+        lane_counts = np.bincount(labels, minlength=num_lanes + 1)[1:num_lanes + 1]
+    else:
+        lane_counts = np.bincount(labels, weights=box_weights, minlength=num_lanes + 1)[1:num_lanes + 1]
+        lane_counts = np.rint(lane_counts).astype(np.int64) #plans are sent as whole cars
+    return lane_counts.tolist()
+
+def process_frame(ip, port, lanes=None, grabber=None, gate=None):
+    frame = None
+    payload = None
+    if grabber is not None: #take newest background frame, no network wait
+        frame, payload, timestamp, stale = grabber.snapshot() #frame and JPEG from the same shot
+        if stale:
+            print("grabber frame is stale, fetching directly")
+            frame = None
+            payload = None
+        elif recorder is not None and payload is not None:
+            recorder.record_frame(payload)
+    if frame is None:
+        frame = capture_frame(ip, port)
+
+    if gate is not None and not gate.should_infer(frame, payload, lanes):
+        return list(gate.last_counts) #scene unchanged, reuse last counts
+    if governor is not None and governor.should_skip():
+        return list(governor.last_counts) #behind the deadline, reuse last counts
+
+    started = time.perf_counter()
+    result, boxes = detect_lane_boxes(frame, lanes)
     lane_counts = get_lane_counts(boxes,lanes)
+    if gate is not None and result is not None:
+        gate.update(lane_counts)
+    if governor is not None and result is not None:
+        governor.record(time.perf_counter() - started, lane_counts)
     return lane_counts
 
-def main():
-    lanes_file = "lanes.npy" #to save lane coordinates after first computation
+def enable_tracking(interval=0.5, lookahead=0.0, **options):
+    """
+    Track cars on every grabbed frame, one every `interval` seconds, instead of
+    counting a single snapshot per cycle. main() then returns the smoothed lane
+    demand (queue plus arrivals within `lookahead` seconds) from the tracker.
+    Options go to LaneTracker.
+    """
+    global tracking_options
+    tracking_options = dict(options, interval=interval, lookahead=lookahead)
 
+def _track_loop(lane_tracker, frame_grabber, store, lanes, interval):
+    last_timestamp = None
+    while True:
+        started = time.monotonic()
+        new_lanes = store.get() #same list until lanes.json changes
+        if new_lanes is not None and new_lanes is not lanes:
+            lanes = new_lanes
+            lane_tracker.set_lanes(lanes, get_lane_mask(lanes))
+        frame, timestamp, stale = frame_grabber.latest()
+        if frame is not None and not stale and timestamp != last_timestamp:
+            last_timestamp = timestamp
+            result, boxes = detect_lane_boxes(frame, lanes)
+            if result is not None:
+                lane_tracker.update(boxes, timestamp)
+        delay = interval - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+
+def start_tracking(store, frame_grabber):
+    """
+    Start the tracking thread on the lanes of a LaneStore, edits reach the tracker on reload.
+    """
+    global tracker
+    options = dict(tracking_options)
+    interval = options.pop("interval")
+    options.pop("lookahead")
+    lanes = store.get()
+    tracker = LaneTracker(lanes, get_lane_mask(lanes), **options)
+    threading.Thread(target=_track_loop, args=(tracker, frame_grabber, store, lanes, interval),
+                     daemon=True, name="lane-tracker").start()
+    return tracker
+
+def set_recorder(new_recorder):
+    """
+    Record the camera frames used by capture_frame / process_frame, None to stop.
+    """
+    global recorder
+    recorder = new_recorder
+
+def enable_governor(deadline=2.5, **options):
+    """
+    Adapt input size, frame skipping and weights so inference stays inside
+    `deadline` seconds per cycle, see InferenceGovernor for options.
+    """
+    global governor
+    options.setdefault("load_model", lambda weights: load_detector(weights=weights))
+    governor = InferenceGovernor(deadline, **options)
+    governor.preload() #lighter weights load in the background, not inside detect_cars
+    return governor
+
+def enable_motion_gate(**options):
+    """
+    Skip inference in main() when the frame did not change, see MotionGate for options.
+    """
+    global motion_gate
+    motion_gate = MotionGate(**options)
+    return motion_gate
+
+@metrics.timed("batch_inference", "Time for one batched model call")
+def detect_cars_batch(frames):
+    """
+    Run one batched model call over several frames.
+    Returns a result per input frame (None where the frame was missing).
+    """
+    valid = [i for i, frame in enumerate(frames) if frame is not None]
+    results = [None] * len(frames)
+    if not valid:
+        print("no frames to run inference on")
+        return results
+    try:
+        batch_results = get_model()([frames[i] for i in valid]) #single call for the whole batch
+    except Exception as e:
+        print(f"Exception occurred during batch inference\n{e}")
+        return results
+    for i, result in zip(valid, batch_results):
+        results[i] = result
+        publish_result(result)
+    return results
+
+_capture_pool = None
+
+def capture_frames(cameras, grabbers=None):
+    """
+    Fetch one frame from each (ip, port) camera concurrently.
+    """
+    global _capture_pool
+    if _capture_pool is None or _capture_pool._max_workers < len(cameras):
+        _capture_pool = ThreadPoolExecutor(max_workers=max(1, len(cameras)), thread_name_prefix="capture")
+
+    def fetch(index):
+        ip, port = cameras[index]
+        grabber = grabbers[index] if grabbers else None
+        if grabber is not None:
+            frame, timestamp, stale = grabber.latest()
+            if not stale:
+                return frame
+        return capture_frame(ip, port)
+
+    return list(_capture_pool.map(fetch, range(len(cameras))))
+
+def process_frames(cameras, lanes_per_camera, grabbers=None):
+    """
+    Multi-camera version of process_frame.
+    cameras -> list of (ip, port), lanes_per_camera -> lanes for each camera.
+    Returns a list of lane counts, one per camera.
+    """
+    frames = capture_frames(cameras, grabbers)
+    results = detect_cars_batch(frames)
+    all_counts = []
+    for result, lanes in zip(results, lanes_per_camera):
+        boxes = extract_boxes(result) if result is not None else None
+        all_counts.append(get_lane_counts(boxes, lanes))
+    return all_counts
+
+def camera_address():
+    return os.environ.get("CAMERA_IP", "172.20.10.2"), int(os.environ.get("CAMERA_PORT", 8080))
+
+def lane_store():
+    """
+    The LaneStore main() reads, tagged with the camera the lanes belong to.
+    """
+    ip, port = camera_address()
+    return get_store(LANES_FILE, camera_id=f"{ip}:{port}")
+
+def main():
     #socket definition
-    ip = "172.20.10.2"
-    port = 8080
+    ip, port = camera_address()
 
-    if os.path.exists(lanes_file):
-        print("Loading saved lanes from lanes.npy...")
-        lanes = np.load(lanes_file, allow_pickle=True)
-    else:
+    #lane coordinates, cached and re-read only when lanes.json changes
+    store = lane_store()
+    lanes = store.get()
+    if lanes is None:
         
       print("Capturing image from camera...")
       frame = capture_frame(ip, port)
@@ -184,13 +643,34 @@ def main():
 
       else:
         print("capture.jpg successfully saved.")
-        lanes = define_lanes_interactively("capture.jpg")
-        np.save(lanes_file, lanes)
-        print("Lanes saved to lanes.npy.")
+        lanes = store.save(define_lanes_interactively("capture.jpg"))
+        print(f"Lanes saved to {LANES_FILE}.")
+
+    global grabber
+    if grabber is None: #long-lived grabber, started on first cycle
+        grabber = FrameGrabber(ip, port, letterboxer=Letterboxer(buffers=1)).start()
+    if tracking_options is not None and tracker is None: #inference moves to the tracking thread
+        start_tracking(store, grabber)
 
-    counts = process_frame(ip, port, lanes)
-    if counts == [0,0,0,0]:
+    #the tracker only sees grabbed frames, if the camera stalls its demand freezes
+    max_age = grabber.max_age + tracking_options["interval"] if tracker is not None else 0
+    last_update = tracker.last_update if tracker is not None else None
+    if last_update is not None and time.time() - last_update <= max_age:
+        counts = tracker.counts(tracking_options["lookahead"])
+        print(f"lane demand: {tracker.demand()}")
+    else:
+        if tracker is not None:
+            print("tracker has no recent frame, counting a snapshot")
+            metrics.inc("tracker_stale_total")
+        counts = process_frame(ip, port, lanes, grabber, motion_gate)
+    if len(counts) != CONTROLLER_LANES: #lanes.json may define more or fewer polygons
+      print(f"{len(counts)} lanes defined, the controller drives {CONTROLLER_LANES}")
+      counts = (list(counts) + [0] * CONTROLLER_LANES)[:CONTROLLER_LANES]
+    if motion_gate is not None:
+      print(f"motion gate: {motion_gate.stats()}")
+    if not any(counts):
       print("Failed to process frame.")
+      metrics.inc("zero_counts_total")
     else:
       print(f"Cars detected per lane: {counts}")
     
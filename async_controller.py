@@ -0,0 +1,240 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from serial_protocol import PlanSender
+from traffic_logic import (fixed_time_counts, lane_weights, make_plan, max_capacity, parse_emergency_line,
+                           parse_ultrasonic_line, remaining_plan)
+import metrics
+
+SERIAL_PORT = os.environ.get("ESP32_PORT", 'COM3')  # Change COM port as needed
+
+class PipelinedController:
+    """
+    Asyncio controller that keeps perception running while the lights run.
+    Perception for cycle k+1 is computed during cycle k, so the plan is sent
+    as soon as the "Ultra" line that follows "Ready" arrives, or after
+    ultra_wait seconds without one.
+    """
+
+    def __init__(self, ser, get_counts, max_plan_age=15.0, min_perception_interval=1.0, num_lanes=4,
+                 weights=lane_weights, capacity=max_capacity, name="controller", recorder=None, ready=None,
+                 ultra_wait=1.0):
+        self.ser = ser
+        self.get_counts = get_counts            # blocking perception call, e.g. ai_module.main
+        self.ready = ready                      # returns False while the detector is still loading
+        self.max_plan_age = max_plan_age        # seconds, older perception is not used
+        self.min_perception_interval = min_perception_interval
+        self.num_lanes = num_lanes
+        self.weights = weights
+        self.capacity = capacity
+        self.name = name
+        self.recorder = recorder                # optional recorder.Recorder for sensor lines and plans
+        self.ultra_wait = ultra_wait            # seconds to wait for this cycle's "Ultra" after "Ready"
+
+        self.car_counts = None
+        self.counts_time = 0.0
+        self.ultra_check = None
+        self.plan = None                        # (lane_order, durations, counts, perception timestamp)
+        self.cycle = 0
+        self.plan_sender = PlanSender(ser)
+        self.sent_plan = None                   # (lane_order, durations, counts) the ESP32 is running
+        self._sent_at = None
+        self._preempted_at = None               # IR edge time of an emergency replan waiting for its Ack
+        self._ready_at = None                   # "Ready" seen, plan held back for the cycle's "Ultra"
+        self._reply_deadline = None             # retransmit the pending plan if no reply by then
+
+        # separate threads so a slow inference never delays serial reads
+        self._perception_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="perception")
+        self._serial_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="serial")
+        self._stop = asyncio.Event()
+
+    def _update_plan(self):
+        if self.car_counts is None:
+            return
+        lane_order, durations, counts = make_plan(self.car_counts, self.ultra_check, self.weights, self.capacity)
+        self.plan = (lane_order, durations, counts, self.counts_time)
+
+    async def perception_loop(self):
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            started = time.monotonic()
+            if self.ready is not None and not self.ready():
+                await asyncio.sleep(self.min_perception_interval)  # fixed-time plans until the detector is up
+                continue
+            try:
+                counts = await loop.run_in_executor(self._perception_pool, self.get_counts)
+            except Exception as e:
+                print(f"Exception occurred during perception\n{e}")
+                counts = None
+
+            if counts is not None and len(counts) != self.num_lanes:
+                print(f"perception gave {len(counts)} lane counts [{self.name}], expected {self.num_lanes}")
+                counts = None
+            if counts is not None:
+                self.car_counts = counts
+                self.counts_time = time.time()
+                self._update_plan()  # precompute the next plan now, not when "Ready" arrives
+
+            delay = self.min_perception_interval - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def current_plan(self):
+        """
+        Most recent plan if its perception data is fresh enough,
+        otherwise a fallback plan from the ultrasonic sensors only.
+        """
+        if self.plan is not None and time.time() - self.plan[3] <= self.max_plan_age:
+            return self.plan[:3]
+        if self.ready is not None and not self.ready():
+            print("Detector still loading, using fixed-time counts.")
+            metrics.inc("degraded_cycles_total")
+            counts = (fixed_time_counts * self.num_lanes)[:self.num_lanes]
+            return make_plan(counts, self.ultra_check, self.weights, self.capacity)
+        print("No fresh perception data, using fallback counts.")
+        metrics.inc("count_fallback_total")
+        return make_plan([0] * self.num_lanes, self.ultra_check, self.weights, self.capacity)
+
+    def send_plan(self, lane_order, durations):
+        # single framed write, the Ack/Nack is handled in serial_loop and check_timeouts
+        self._sent_at = time.perf_counter()
+        self.plan_sender.write(lane_order, durations)
+        self._reply_deadline = time.monotonic() + self.plan_sender.reply_timeout
+
+    def send_cycle_plan(self):
+        ready_at, self._ready_at = self._ready_at, None
+        lane_order, durations, counts = self.current_plan()
+        self.send_plan(lane_order, durations)
+        self.sent_plan = (lane_order, durations, counts)
+        metrics.observe("cycle", time.monotonic() - ready_at)
+        if self.recorder is not None:
+            self.recorder.record_plan(lane_order, durations, counts)
+        metrics.log_event("plan", intersection=self.name, cycle=self.cycle, counts=counts, order=lane_order, times=durations)
+        print(f"Traffic cycle {self.cycle}: counts = {counts}, order = {[x + 1 for x in lane_order]}, times = {durations}")
+
+    def check_timeouts(self):
+        """
+        Called periodically: send the held-back plan if no "Ultra" came,
+        retransmit a plan whose Ack got lost.
+        """
+        now = time.monotonic()
+        if self._ready_at is not None and now - self._ready_at >= self.ultra_wait:
+            print(f"No ultrasonic reading after Ready [{self.name}], sending the plan without it.")
+            self.send_cycle_plan()
+        if self._reply_deadline is not None and now >= self._reply_deadline:
+            self._delivery(self.plan_sender.retransmit())
+
+    def _delivery(self, status):
+        if status == "retry":
+            self._reply_deadline = time.monotonic() + self.plan_sender.reply_timeout
+            return
+        self._reply_deadline = None
+        if status != "ack":
+            print(f"plan delivery: {status}")
+        if status == "ack" and self._sent_at is not None:
+            metrics.observe("serial_write", time.perf_counter() - self._sent_at)
+        if status == "ack" and self._preempted_at is not None:
+            metrics.observe("preemption", time.perf_counter() - self._preempted_at)
+        elif status == "failed":
+            metrics.inc("ready_missed_total")
+        self._preempted_at = None
+
+    def process_line(self, line):
+        """
+        handle_line, with a garbled line logged instead of stopping the serial loop.
+        """
+        try:
+            self.handle_line(line)
+        except Exception as e:
+            print(f"Exception occurred while handling {line!r} [{self.name}]\n{e}")
+            metrics.inc("line_errors_total")
+
+    def handle_line(self, line):
+        print(f"ESP [{self.name}]:", line)
+        if self.recorder is not None:
+            self.recorder.record_line(line)
+
+        status = self.plan_sender.handle_reply(line)
+        if status is not None:
+            self._delivery(status)
+            return
+
+        if line.startswith("Emerg,"):
+            self.handle_emergency(line)
+        elif line.startswith("Ultra"):
+            self.ultra_check = parse_ultrasonic_line(line)
+            self._update_plan()
+            if self._ready_at is not None:  # this cycle's reading, the plan can go now
+                self.send_cycle_plan()
+        elif "Ready" in line:
+            self.cycle += 1
+            self._ready_at = time.monotonic()
+
+    def handle_emergency(self, line):
+        """
+        Priority path: the ESP32 cut the cycle short for an emergency vehicle,
+        send the remaining lanes re-sorted by priority right away.
+        """
+        lane, phase, firmware_ms = parse_emergency_line(line)
+        detected_at = time.perf_counter() - firmware_ms / 1000
+        metrics.inc("emergency_total")
+        print(f"EMERGENCY [{self.name}] on lane {lane + 1}, preempting phase {phase + 1}")
+        if self.sent_plan is None:
+            return
+        lane_order, durations, counts = self.sent_plan
+        # newest perception counts if there are any, the cycle's counts otherwise
+        if self.plan is not None and time.time() - self.plan[3] <= self.max_plan_age:
+            counts = self.plan[2]
+        replan = remaining_plan(counts, lane_order, durations, phase, lane, self.weights)
+        if replan is None:
+            return
+        self._preempted_at = detected_at
+        self.send_plan(*replan)
+        self.sent_plan = (replan[0], replan[1], counts)
+        if self.recorder is not None:
+            self.recorder.record_plan(replan[0], replan[1], counts, replan=True)
+        metrics.log_event("preemption", intersection=self.name, lane=lane, phase=phase, order=replan[0], times=replan[1])
+
+    async def serial_loop(self):
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            raw = await loop.run_in_executor(self._serial_pool, self.ser.readline)
+            line = raw.decode(errors="ignore").strip()
+            if line:
+                self.process_line(line)
+
+    async def timeout_loop(self, interval=0.05):
+        while not self._stop.is_set():
+            try:
+                self.check_timeouts()
+            except Exception as e:  # e.g. the port went away during a retransmit
+                print(f"Exception occurred while checking plan timeouts [{self.name}]\n{e}")
+            await asyncio.sleep(interval)
+
+    async def run(self):
+        await asyncio.gather(self.perception_loop(), self.serial_loop(), self.timeout_loop())
+
+    def stop(self):
+        self._stop.set()
+
+def main():
+    from ai_module import main as get_lane_counts
+    from ai_module import detector_ready, set_headless, warm_up
+
+    set_headless(True)
+    warm_up()  # plans start right away, vision counts once the detector is ready
+    ser = serial.Serial(SERIAL_PORT, 9600, timeout=1)
+    time.sleep(2)  # Wait for connection
+
+    controller = PipelinedController(ser, get_lane_counts, ready=detector_ready)
+    try:
+        asyncio.run(controller.run())
+    except KeyboardInterrupt:
+        print("Stopping controller.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Per-stage latency benchmark for the ai_module perception pipeline.
+
+    python -m benchmarks.bench_perception --frames recorded/ --out bench.json
+    python -m benchmarks.bench_perception --scaling --out scaling.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# decode + resize_image is the old two-step path, letterbox_decode is what FrameGrabber runs
+STAGES = ("decode", "resize_image", "letterbox_decode", "detect_cars", "extract_boxes", "get_lane_counts")
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+    except ImportError:
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+        except ImportError:
+            return None
+
+
+def summarize(samples):
+    arr = np.asarray(samples, dtype=np.float64) * 1000
+    if arr.size == 0:
+        return None
+    return {
+        "n": int(arr.size),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "mean_ms": float(arr.mean()),
+        "fps": float(1000 / arr.mean()) if arr.mean() > 0 else None,
+    }
+
+
+def load_payloads(frames_dir, limit=None):
+    paths = sorted(glob.glob(os.path.join(frames_dir, "*.jpg")) + glob.glob(os.path.join(frames_dir, "*.jpeg")))
+    payloads = []
+    for path in paths[:limit]:
+        with open(path, "rb") as f:
+            payloads.append(f.read())
+    return payloads
+
+
+def strip_lanes(num_lanes, size=640):
+    # equal vertical strips covering the frame, used when no lane file exists
+    edges = np.linspace(0, size - 1, num_lanes + 1).astype(np.int32)
+    return [np.array([[edges[i], 0], [edges[i + 1], 0], [edges[i + 1], size - 1], [edges[i], size - 1]], dtype=np.int32)
+            for i in range(num_lanes)]
+
+
+def bench_pipeline(payloads, lanes, repeat=1, warmup=2):
+    import ai_module
+    from preprocess import Letterboxer
+
+    ai_module.set_headless(True)  # never time the image viewer
+    letterboxer = Letterboxer(buffers=1)
+    timings = {stage: [] for stage in STAGES}
+    for frame_index in range(len(payloads) * repeat + warmup):
+        data = payloads[frame_index % len(payloads)]
+        record = frame_index >= warmup
+
+        t0 = time.perf_counter()
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        t1 = time.perf_counter()
+        ai_module.resize_image(frame)
+        t2 = time.perf_counter()
+        frame, _ = letterboxer.decode(data)
+        t3 = time.perf_counter()
+        result = ai_module.detect_cars(frame)
+        t4 = time.perf_counter()
+        boxes = ai_module.extract_boxes(result) if result is not None else None
+        t5 = time.perf_counter()
+        ai_module.get_lane_counts(boxes, lanes)
+        t6 = time.perf_counter()
+
+        if record:
+            for stage, start, end in zip(STAGES, (t0, t1, t2, t3, t4, t5), (t1, t2, t3, t4, t5, t6)):
+                timings[stage].append(end - start)
+
+    return {stage: summarize(samples) for stage, samples in timings.items()}
+
+
+def bench_lane_scaling(box_counts=(10, 100, 1000, 10000), lane_counts=(2, 4, 8, 16), iterations=50, seed=0):
+    from ai_module import get_lane_counts
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for num_lanes in lane_counts:
+        lanes = strip_lanes(num_lanes)
+        for num_boxes in box_counts:
+            boxes = [tuple(p) for p in rng.uniform(0, 640, size=(num_boxes, 2))]
+            get_lane_counts(boxes, lanes)  # builds the cached lane mask outside the timing
+            samples = []
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                get_lane_counts(boxes, lanes)
+                samples.append(time.perf_counter() - t0)
+            row = {"lanes": num_lanes, "boxes": num_boxes}
+            row.update(summarize(samples))
+            rows.append(row)
+            print(f"lanes={num_lanes:<3} boxes={num_boxes:<6} p50={row['p50_ms']:.3f} ms p99={row['p99_ms']:.3f} ms")
+    return rows
+
+
+def print_table(stages):
+    print(f"{'stage':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'fps':>10}")
+    for stage, row in stages.items():
+        if row is None:
+            continue
+        print(f"{stage:<18}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['fps']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each ai_module perception stage")
+    parser.add_argument("--frames", help="folder of recorded .jpg frames to replay")
+    parser.add_argument("--lanes", default="lanes.json", help="lane file (.json or old .npy), equal strips are used if missing")
+    parser.add_argument("--num-lanes", type=int, default=4, help="strip count when the lane file is missing")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--scaling", action="store_true", help="vary boxes per frame and lane count for lane assignment")
+    parser.add_argument("--out", default="bench_perception.json")
+    args = parser.parse_args()
+
+    report = {"python": platform.python_version(), "machine": platform.machine(), "time": time.time()}
+
+    if args.frames:
+        payloads = load_payloads(args.frames, args.limit)
+        if not payloads:
+            parser.error(f"no .jpg frames found in {args.frames}")
+        from lane_config import read_lanes
+
+        lanes = read_lanes(args.lanes) if os.path.exists(args.lanes) else None
+        if lanes is None:
+            lanes = strip_lanes(args.num_lanes)
+        stages = bench_pipeline(payloads, lanes, repeat=args.repeat)
+        print_table(stages)
+        report["frames"] = len(payloads) * args.repeat
+        report["stages"] = stages
+
+    if args.scaling:
+        report["lane_scaling"] = bench_lane_scaling()
+
+    if "stages" not in report and "lane_scaling" not in report:
+        parser.error("nothing to run, pass --frames and/or --scaling")
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    print(f"peak RSS: {report['peak_rss_mb']} MB")
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
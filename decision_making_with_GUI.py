@@ -1,52 +1,87 @@
+import atexit
+import logging
+import os
 import serial
 import time
 import threading
 import tkinter as tk
 from tkinter import ttk
 from ai_module import main as get_lane_counts
+from ai_module import detector_ready, inference_roi, lane_store, set_headless, warm_up
+from gui_bridge import PreviewPanel, PreviewSink, UIBridge
+from serial_protocol import PlanSender
+from serial_reader import SerialReader, SensorState
+from preemption import PreemptionHandler
+from traffic_logic import lane_weights, max_capacity, fixed_time_counts, apply_ultrasonic, sort_lanes_by_priority, get_green_duration
+import metrics
+from ai_module import set_recorder
+from recorder import Recorder
 
 # Serial setup
-ser = serial.Serial('COM3', 9600, timeout=1)
+ser = serial.Serial(os.environ.get("ESP32_PORT", 'COM3'), 9600, timeout=1)
 time.sleep(2)
 
-lane_weights = [1.2, 1, 1.2, 1]
-max_capacity = [2, 3, 2, 3]
+ULTRA_TIMEOUT = 2.0  # the ESP32 sends "Ultra" 0.1-1.5 s after "Ready"
+PLAN_WINDOW = 5.0    # planTimeout in ESP_Code.ino, a "Ready" older than this has no listener left
+
+METRICS_PORT = 9100  # Prometheus text at http://127.0.0.1:9100/metrics, None to disable
+
+RECORD_DIR = None  # set to a folder to record frames, sensor lines and plans for replay
+
+recorder = Recorder(RECORD_DIR) if RECORD_DIR else None
+if recorder is not None:
+    atexit.register(recorder.flush)  # plans flush as they are recorded, this covers the lines after the last one
+set_recorder(recorder)
+
+# Only the reader thread touches ser for reading, everything else looks at the sensor store
+sensors = SensorState()
+plan_sender = PlanSender(ser, state=sensors)  # framed plan + Ack/Nack, see serial_protocol.py
+preemption = PreemptionHandler(plan_sender, lane_weights, recorder=recorder,
+                               on_preempt=lambda lane, replan: bridge.post("emergency", (lane, replan)))
+reader = SerialReader(ser, sensors, recorder=recorder, priority={"Emerg": preemption.submit}).start()
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+if METRICS_PORT:
+    metrics.start_http_server(METRICS_PORT)
+
+# Load the detector in the background, cycles run on fixed-time + ultrasonic counts until it is ready
+warm_up()
+
+EMERGENCY_DURATION = 10  # emergencyDuration in ESP_Code.ino
+YELLOW_DURATION = 2
+
+SHOW_PREVIEW = True  # live camera panel with detections, lane overlays and stage timings
+GUI_REFRESH_MS = 100  # the GUI applies queued updates at this rate
 
 # --- Functions from your code ---
 
 def set_car_counts():
+    if not detector_ready():
+        metrics.inc("degraded_cycles_total")
+        return list(fixed_time_counts)
     counts = get_lane_counts()
     if counts is None:
         counts = [0, 0, 0, 0]
+        metrics.inc("count_fallback_total")
     return counts
 
-def parse_ultrasonic_line(line):
-    parts = line.split(',')
-    return [int(parts[i + 1]) for i in range(1, len(parts), 2)]
-
-def update_car_counts(car_counts):
-    line = ser.readline().decode().strip()
-    if line.startswith("Ultra"):
-        ultra_check = parse_ultrasonic_line(line)
-        for i in range(4):
-            if ultra_check[i] == 1:
-                car_counts[i] = max_capacity[i]
-        update_status_labels(car_counts, ultra_check)
-
-def sort_lanes_by_priority(car_counts, lane_weights):
-    lane_priorities = [(i, car_counts[i] * lane_weights[i]) for i in range(4)]
-    lane_priorities.sort(key=lambda x: x[1], reverse=True)
-    return [lane[0] for lane in lane_priorities]
-
-def get_green_duration(car_counts):
-    return [2 * c for c in car_counts]
+def update_car_counts(car_counts, ready_seq):
+    reading = sensors.wait_for(("Ultra",), ready_seq, ULTRA_TIMEOUT)  # this cycle's reading only
+    ultra_check = reading.value if reading is not None else None
+    if ultra_check:
+        apply_ultrasonic(car_counts, ultra_check, max_capacity)
+    bridge.post("counts", (list(car_counts), ultra_check))
 
 def send_to_esp32(lane_order, lane_times):
-    ser.write(f"Times,{','.join(map(str, lane_times))}\n".encode())
-    time.sleep(0.1)
-    ser.write(f"Order,{','.join(map(str, lane_order))}\n".encode())
+    with metrics.timer("serial_write", "Plan write until Ack"):
+        delivered = plan_sender.send(lane_order, lane_times)
+    if recorder is not None:
+        recorder.record_plan(lane_order, lane_times)
+    if not delivered:
+        print("ESP32 did not acknowledge the plan.")
+        metrics.inc("ready_missed_total")
 
-# --- GUI-related functions ---
+# --- GUI-related functions (run on the Tk thread only, via the bridge) ---
 
 def update_status_labels(counts, sensors=None):
     for i in range(4):
@@ -57,41 +92,73 @@ def update_status_labels(counts, sensors=None):
 def update_phase_label(lane, phase):
     status_label['text'] = f"Lane {lane+1} → {phase}"
 
-def traffic_light_loop():
-
-    # --- Reset & update car counts
-    counts = [0, 0, 0, 0]
-    counts = set_car_counts()
-    update_car_counts(counts)
+phase_jobs = []
 
-    # --- Determine order and durations
-    lane_order = sort_lanes_by_priority(counts, lane_weights)
-    durations = get_green_duration(counts)
+def cancel_phases():
+    for job in phase_jobs:
+        root.after_cancel(job)
+    phase_jobs.clear()
 
-    # --- Send to ESP32
-    send_to_esp32(lane_order, durations)
-
-    # --- Update GUI with lane order and durations
+def show_plan(plan, start=0, replanned=False):
+    lane_order, durations = plan
     order_label['text'] = f"Lane Order: {[lane+1 for lane in lane_order]}"
     duration_label['text'] = f"Green Durations: {durations}"
 
-
-    # --- Display lane phases
+    # --- Display lane phases with root.after instead of sleeping in the control thread
+    if not start:
+        cancel_phases()
+    t = start
     for lane in lane_order:
-        update_phase_label(lane, f"GREEN ({durations[lane]}s)")
-        time.sleep(durations[lane])
-        update_phase_label(lane, "YELLOW (2s)")
-        time.sleep(2)
-        update_phase_label(lane, "RED (1s)")
-        time.sleep(1)
+        if replanned and durations[lane] <= 0:
+            continue  # served before the emergency, the ESP32 skips it
+        phase_jobs.append(root.after(int(t * 1000), update_phase_label, lane, f"GREEN ({durations[lane]}s)"))
+        t += durations[lane]
+        phase_jobs.append(root.after(int(t * 1000), update_phase_label, lane, f"YELLOW ({YELLOW_DURATION}s)"))
+        t += YELLOW_DURATION
+        phase_jobs.append(root.after(int(t * 1000), update_phase_label, lane, "RED (1s)"))
+        t += 1
+    phase_jobs.append(root.after(int(t * 1000), status_label.configure, {'text': "Waiting for ESP32..."}))
+
+def show_emergency(payload):
+    # the ESP32 interrupted the current phase, resync the phase display with it
+    lane, replan = payload
+    cancel_phases()
+    update_phase_label(lane, f"EMERGENCY GREEN ({EMERGENCY_DURATION}s)")
+    start = EMERGENCY_DURATION + YELLOW_DURATION
+    if replan is not None:
+        show_plan(replan, start=start, replanned=True)
+    else:
+        phase_jobs.append(root.after(start * 1000, status_label.configure, {'text': "Waiting for ESP32..."}))
+
+def traffic_light_loop(ready_seq):
+
+    with metrics.timer("cycle", "Ready until the plan is delivered"):
+        # --- Reset & update car counts
+        counts = [0, 0, 0, 0]
+        counts = set_car_counts()
+        update_car_counts(counts, ready_seq)
+
+        # --- Determine order and durations
+        lane_order = sort_lanes_by_priority(counts, lane_weights)
+        durations = get_green_duration(counts)
 
-    status_label['text'] = "Waiting for ESP32..."
+        # --- Send to ESP32
+        send_to_esp32(lane_order, durations)
+        preemption.set_plan(lane_order, durations, counts)
+    metrics.log_event("plan", counts=counts, order=lane_order, times=durations)
+
+    # --- Update GUI with lane order and durations, the phases are timed on the Tk thread
+    bridge.post("plan", (lane_order, durations))
 
 def wait_for_ready_and_start():
+    last_ready = 0
     while True:
-        line = ser.readline().decode().strip()
-        if "Ready" in line:
-            traffic_light_loop()
+        ready = sensors.wait_for(("Ready",), last_ready)
+        last_ready = ready.seq
+        if time.time() - ready.ts > PLAN_WINDOW:
+            metrics.inc("stale_ready_total")  # the ESP32 stopped waiting for this plan
+            continue
+        traffic_light_loop(last_ready)
 
 def start_traffic_loop():
     threading.Thread(target=wait_for_ready_and_start, daemon=True).start()
@@ -100,7 +167,7 @@ def start_traffic_loop():
 
 root = tk.Tk()
 root.title("Smart Traffic Controller")
-root.geometry("400x400")
+root.geometry("400x800" if SHOW_PREVIEW else "400x400")
 
 frame = ttk.Frame(root, padding=20)
 frame.pack(fill=tk.BOTH, expand=True)
@@ -128,4 +195,20 @@ duration_label.pack()
 start_button = ttk.Button(frame, text="Start Traffic Loop", command=start_traffic_loop)
 start_button.pack()
 
+# --- Worker threads never touch widgets, they post to the bridge
+bridge = UIBridge(root, refresh_ms=GUI_REFRESH_MS)
+bridge.register("counts", lambda payload: update_status_labels(*payload))
+bridge.register("plan", show_plan)
+bridge.register("emergency", show_emergency)
+
+if SHOW_PREVIEW:
+    # same cached store ai_module uses, re-read on each draw
+    preview_panel = PreviewPanel(frame, store=lane_store(), roi=inference_roi)
+    bridge.register("preview", preview_panel.show)
+    set_headless(True, PreviewSink(bridge))
+else:
+    set_headless(True)
+
+bridge.start()
+
 root.mainloop()
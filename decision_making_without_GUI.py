@@ -1,76 +1,91 @@
+import atexit
+import logging
+import os
 import serial
 import time
 from ai_module import main as get_lane_counts
-
-ser = serial.Serial('COM3', 9600, timeout=1)  # Change COM port as needed
+from ai_module import detector_ready, set_headless, warm_up
+from snapshot_sink import SnapshotSink
+from serial_protocol import PlanSender
+from serial_reader import SerialReader, SensorState
+from preemption import PreemptionHandler
+from traffic_logic import lane_weights, max_capacity, fixed_time_counts, apply_ultrasonic, sort_lanes_by_priority, get_green_duration
+import metrics
+from ai_module import set_recorder
+from recorder import Recorder
+
+SNAPSHOT_DIR = None  # set to a folder to keep every Nth annotated frame
+
+# Headless by default, visualization only through the async snapshot writer
+set_headless(True, SnapshotSink(SNAPSHOT_DIR, every_n=10) if SNAPSHOT_DIR else None)
+
+ser = serial.Serial(os.environ.get("ESP32_PORT", 'COM3'), 9600, timeout=1)  # Change COM port as needed
 time.sleep(2)  # Wait for connection
 
-lane_weights = [1.2, 1, 1.2, 1]  # Weight of each lane (e.g., Lane 1: weight 1, Lane 2: weight 2, etc.)
+ULTRA_TIMEOUT = 2.0  # the ESP32 sends "Ultra" 0.1-1.5 s after "Ready"
+PLAN_WINDOW = 5.0    # planTimeout in ESP_Code.ino, a "Ready" older than this has no listener left
+
+METRICS_PORT = 9100  # Prometheus text at http://127.0.0.1:9100/metrics, None to disable
+
+RECORD_DIR = None  # set to a folder to record frames, sensor lines and plans for replay
+
+recorder = Recorder(RECORD_DIR) if RECORD_DIR else None
+if recorder is not None:
+    atexit.register(recorder.flush)  # plans flush as they are recorded, this covers the lines after the last one
+set_recorder(recorder)
+
+# Only the reader thread touches ser for reading, everything else looks at the sensor store
+sensors = SensorState()
+plan_sender = PlanSender(ser, state=sensors)  # framed plan + Ack/Nack, see serial_protocol.py
+preemption = PreemptionHandler(plan_sender, lane_weights, recorder=recorder)  # replans right after "Emerg"
+reader = SerialReader(ser, sensors, on_line=lambda line: print("ESP:", line), recorder=recorder,
+                      priority={"Emerg": preemption.submit}).start()
 
-max_capacity = [2, 3, 2, 3]
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+if METRICS_PORT:
+    metrics.start_http_server(METRICS_PORT)
+
+# Load the detector in the background, cycles run on fixed-time + ultrasonic counts until it is ready
+warm_up()
 
 #Function to get car counts from CV model
 def set_car_counts():
+    if not detector_ready():
+        print("Detector still loading, using fixed-time counts.")
+        metrics.inc("degraded_cycles_total")
+        return list(fixed_time_counts)
     car_counts = get_lane_counts()
     if car_counts is None:
         print("Failed to get car counts.")
         car_counts = [0, 0, 0, 0]  # fallback values
+        metrics.inc("count_fallback_total")
     print(f"car counts = {car_counts}")    
 
     return car_counts
 
-def parse_ultrasonic_line(line):
-    parts = line.split(',')
-    # Format: "Ultra,L1,1,L2,0,L3,0,L4,1"
-    values = [int(parts[i + 1]) for i in range(1, len(parts), 2)]
-    return values
-
-# Function to read data from ESP32 and update car counts
-def update_car_counts(car_counts):
-    line = ser.readline().decode().strip()
-    if line.startswith("Ultra"):
-            ultra_check = parse_ultrasonic_line(line)
+# Function to update car counts with the ultrasonic reading that follows this cycle's "Ready"
+def update_car_counts(car_counts, ready_seq):
+    reading = sensors.wait_for(("Ultra",), ready_seq, ULTRA_TIMEOUT)
+    if reading is None:
+        print("No ultrasonic reading this cycle, using camera counts only.")
+        return car_counts
 
     # For each lane, if status is 1 (indicating a car), set the count to max_capacity
-    for i in range(4):       
-        # If car is detected, set lane to maximum capacity
-        if ultra_check[i] == 1:
-            car_counts[i] = max_capacity[i]
-
-# Function to sort lanes based on their priority
-def sort_lanes_by_priority(car_counts, lane_weights):
-    lane_priorities = []
-    
-    # Calculate priority for each lane
-    for i in range(4):
-        priority = car_counts[i] * lane_weights[i]
-        lane_priorities.append((i, priority))
-    
-    # Sort lanes by priority (highest priority first)
-    lane_priorities.sort(key=lambda x: x[1], reverse=True)
-    
-    # Return the sorted order of lanes based on priority
-    return [lane[0] for lane in lane_priorities]
-
-#Function to calculate the green duration for each lane
-def get_green_duration(car_counts):
-    green_duration = []
-    
-    for i in range(4):
-        duration = 2 * car_counts[i]
-        green_duration.append(duration)
-
-    return green_duration
+    return apply_ultrasonic(car_counts, reading.value, max_capacity)
 
 # Function to send traffic order and durations to ESP32
 def send_to_esp32(lane_order, lane_times):
     print(lane_times)
     print([x + 1 for x in lane_order])
-    ser.write(f"Times,{','.join(map(str, lane_times))}\n".encode())
-    time.sleep(0.1)
-    ser.write(f"Order,{','.join(map(str, lane_order))}\n".encode())
-
-def traffic_light_loop():
+    with metrics.timer("serial_write", "Plan write until Ack"):
+        delivered = plan_sender.send(lane_order, lane_times)
+    if recorder is not None:
+        recorder.record_plan(lane_order, lane_times)
+    if not delivered:
+        print("ESP32 did not acknowledge the plan.")
+        metrics.inc("ready_missed_total")
+
+def traffic_light_loop(ready_seq):
     # Start the traffic light cycle
     traffic_cycle_counter = 0  # To keep track of how many traffic cycles have passed
 
@@ -84,7 +99,7 @@ def traffic_light_loop():
     car_counts = set_car_counts()
 
     #--- Update car count based on ultrasonic
-    update_car_counts(car_counts)
+    update_car_counts(car_counts, ready_seq)
 
     #--- Get the dynamic lane order based on current traffic (update in each cycle)
     dynamic_lane_order = sort_lanes_by_priority(car_counts, lane_weights)
@@ -94,6 +109,8 @@ def traffic_light_loop():
 
     #--- Send data to ESP32
     send_to_esp32(dynamic_lane_order, green_duration)
+    preemption.set_plan(dynamic_lane_order, green_duration, car_counts)
+    metrics.log_event("plan", counts=car_counts, order=dynamic_lane_order, times=green_duration)
 
     # --- Start rotating traffic lights based on dynamic lane order
     for lane_index in dynamic_lane_order:
@@ -108,12 +125,16 @@ def traffic_light_loop():
         #--- Red light phase
         print(f"All lanes -> RED for 1 second")     
 
+# Pipelined alternative: async_controller.py computes the next plan while the lights run
+last_ready = 0
 while True:
     # Wait for ESP32 to send "Ready"
-    while True:
-        line = ser.readline().decode().strip()
-        print("ESP:", line)
-        if "Ready" in line:
-            break
-
-    traffic_light_loop()
+    ready = sensors.wait_for(("Ready",), last_ready)
+    last_ready = ready.seq
+    if time.time() - ready.ts > PLAN_WINDOW:
+        print("Skipping a stale Ready, the ESP32 stopped waiting for a plan.")
+        metrics.inc("stale_ready_total")
+        continue
+
+    with metrics.timer("cycle", "Ready until the plan is delivered"):
+        traffic_light_loop(last_ready)
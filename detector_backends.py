@@ -0,0 +1,203 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from preprocess import Letterboxer
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+
+def list_images(folder):
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(folder, pattern)))
+    return sorted(paths)
+
+
+def load_frames(folder, limit=None):
+    """
+    Read and letterbox images from a folder the same way capture_frame does.
+    """
+    letterboxer = Letterboxer(buffers=1)
+    frames = []
+    for path in list_images(folder)[:limit]:
+        with open(path, "rb") as f:
+            frame, layout = letterboxer.decode(f.read())
+        if frame is not None:
+            frames.append(frame.copy())  # canvas is reused, keep our own copy
+    return frames
+
+
+def exported_path(weights, backend, int8=False):
+    base, _ = os.path.splitext(weights)
+    if backend == "pytorch":
+        return weights
+    if backend == "onnx":
+        return f"{base}_int8.onnx" if int8 else f"{base}.onnx"
+    if backend == "openvino":
+        return f"{base}_int8_openvino_model" if int8 else f"{base}_openvino_model"
+    raise ValueError(f"unknown backend {backend}, expected one of {BACKENDS}")
+
+
+def _write_calibration_yaml(calib_dir, names):
+    # ultralytics int8 export reads its calibration images through a dataset yaml
+    calib_dir = os.path.abspath(calib_dir)
+    yaml_path = os.path.join(calib_dir, "calibration.yaml")
+    with open(yaml_path, "w") as f:
+        f.write(f"path: {calib_dir}\ntrain: .\nval: .\nnames:\n")
+        for index, name in names.items():
+            f.write(f"  {index}: {name}\n")
+    return yaml_path
+
+
+class _CalibrationReader:
+    """
+    Feeds letterboxed calibration frames to onnxruntime static quantization.
+    """
+
+    def __init__(self, frames, input_name):
+        self.input_name = input_name
+        self._iter = iter(frames)
+
+    def get_next(self):
+        frame = next(self._iter, None)
+        if frame is None:
+            return None
+        blob = frame[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0  # BGR HWC -> RGB NCHW
+        return {self.input_name: np.ascontiguousarray(blob)}
+
+
+def _quantize_onnx(fp32_path, int8_path, calib_dir, limit=200):
+    import onnxruntime
+    from onnxruntime.quantization import QuantType, quantize_static
+
+    frames = load_frames(calib_dir, limit)
+    if not frames:
+        raise ValueError(f"no calibration images found in {calib_dir}")
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    quantize_static(fp32_path, int8_path, _CalibrationReader(frames, input_name),
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+
+def export_model(weights="best.pt", backend="onnx", int8=False, calib_dir=None, imgsz=640, force=False):
+    """
+    Export weights once to the given backend and return the exported path.
+    An existing export is reused unless force is set.
+    """
+    target = exported_path(weights, backend, int8)
+    if backend == "pytorch" or (os.path.exists(target) and not force):
+        return target
+    if int8 and not calib_dir:
+        raise ValueError("int8 export needs a calibration folder of captured frames")
+
+    from ultralytics import YOLO
+    model = YOLO(weights)
+
+    if backend == "onnx":
+        fp32_path = exported_path(weights, "onnx")
+        if force or not os.path.exists(fp32_path):
+            # dynamic input: ROI crops and the governor's smaller imgsz levels feed other sizes
+            fp32_path = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if int8:
+            print(f"Quantizing {fp32_path} to INT8 using frames from {calib_dir}...")
+            _quantize_onnx(fp32_path, target, calib_dir)
+        return target
+
+    # openvino
+    kwargs = {"format": "openvino", "imgsz": imgsz, "dynamic": True}
+    if int8:
+        kwargs.update(int8=True, data=_write_calibration_yaml(calib_dir, model.names))
+    path = model.export(**kwargs)
+    if os.path.abspath(path) != os.path.abspath(target):
+        os.replace(path, target)
+    return target
+
+
+def load_detector(backend="pytorch", weights="best.pt", int8=False, calib_dir=None, imgsz=640):
+    """
+    Load a YOLO detector for the chosen backend, exporting it first if needed.
+    """
+    from ultralytics import YOLO
+
+    path = export_model(weights, backend, int8=int8, calib_dir=calib_dir, imgsz=imgsz)
+    print(f"Loading {backend}{' int8' if int8 else ''} detector from {path}...")
+    return YOLO(path, task="detect")
+
+
+def _run_frames(model, frames, warmup=3):
+    for frame in frames[:warmup]:
+        model(frame, verbose=False)
+
+    latencies = []
+    counts = []
+    started = time.perf_counter()
+    for frame in frames:
+        t0 = time.perf_counter()
+        result = model(frame, verbose=False)[0]
+        latencies.append(time.perf_counter() - t0)
+        counts.append(len(result.boxes))
+    total = time.perf_counter() - started
+    return np.array(latencies), np.array(counts), total
+
+
+def compare_backends(frames_dir, backends=BACKENDS, weights="best.pt", int8=False, calib_dir=None, limit=None):
+    """
+    Run every backend on the same frames and report latency, throughput
+    and detection-count agreement against the PyTorch baseline.
+    """
+    frames = load_frames(frames_dir, limit)
+    if not frames:
+        print(f"no frames found in {frames_dir}")
+        return {}
+
+    report = {}
+    baseline_counts = None
+    for backend in ("pytorch",) + tuple(b for b in backends if b != "pytorch"):
+        use_int8 = int8 and backend != "pytorch"
+        model = load_detector(backend, weights, int8=use_int8, calib_dir=calib_dir)
+        latencies, counts, total = _run_frames(model, frames)
+        if baseline_counts is None:
+            baseline_counts = counts
+
+        name = f"{backend}-int8" if use_int8 else backend
+        report[name] = {
+            "frames": len(frames),
+            "mean_ms": float(latencies.mean() * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+            "fps": len(frames) / total,
+            "count_agreement": float(np.mean(counts == baseline_counts)),
+            "mean_abs_count_diff": float(np.mean(np.abs(counts - baseline_counts))),
+        }
+
+    print(f"{'backend':<16}{'mean ms':>10}{'p95 ms':>10}{'fps':>8}{'agree':>8}{'|diff|':>8}")
+    for name, row in report.items():
+        print(f"{name:<16}{row['mean_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['fps']:>8.1f}"
+              f"{row['count_agreement']:>8.2f}{row['mean_abs_count_diff']:>8.2f}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and compare CPU detector backends")
+    parser.add_argument("command", choices=["export", "compare"])
+    parser.add_argument("--backend", choices=BACKENDS, default="onnx")
+    parser.add_argument("--weights", default="best.pt")
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--calib-dir", help="folder of captured frames used for INT8 calibration")
+    parser.add_argument("--frames-dir", help="folder of frames for the comparison")
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(export_model(args.weights, args.backend, int8=args.int8, calib_dir=args.calib_dir, force=True))
+    else:
+        compare_backends(args.frames_dir or args.calib_dir, backends=("pytorch", args.backend),
+                         weights=args.weights, int8=args.int8, calib_dir=args.calib_dir, limit=args.limit)
+
+
+if __name__ == "__main__":
+    main()
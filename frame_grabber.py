@@ -0,0 +1,131 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+import requests
+
+import metrics
+
+
+class FrameGrabber:
+    """
+    Keeps the newest frame from an IP camera on a background thread.
+    Uses one pooled HTTP session so every shot reuses the same connection.
+    With a letterboxer, shots are decoded into a small pool of canvases;
+    a frame returned by latest() / snapshot() leaves the pool, so it is
+    never overwritten, and only frames nobody took are reused.
+    """
+
+    def __init__(self, ip, port, interval=0.1, max_age=2.0, timeout=5, preprocess=None, letterboxer=None):
+        self.url = f'http://{ip}:{port}/shot.jpg'
+        self.interval = interval    # seconds between shots
+        self.max_age = max_age      # frame older than this is stale
+        self.timeout = timeout
+        self.preprocess = preprocess  # e.g. resize_image, applied on the grabber thread
+        self.letterboxer = letterboxer  # fused decode + letterbox into reused buffers
+        self.layout = None  # scale/padding of the latest frame
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._frame = None
+        self._payload = None  # JPEG bytes of the newest frame, used by MotionGate
+        self._timestamp = 0.0
+        self._last_content = None
+        self._handed_out = False  # latest() gave the current frame away, never write to it again
+        self._free = []           # letterbox canvases no caller holds, reused for the next shots
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+        self.session.close()
+
+    @metrics.timed("grab", "Background grabber time to fetch and decode one shot")
+    def _fetch(self):
+        response = self.session.get(self.url, timeout=self.timeout)
+        if response.status_code != 200:
+            print(f"failed to fetch img -> status code = {response.status_code}")
+            return None
+        self._last_content = response.content
+
+        if self.letterboxer is not None:
+            canvas = self._take_canvas()
+            frame, layout = self.letterboxer.decode(response.content, out=canvas)
+            if frame is None:
+                self._release(canvas)
+            else:
+                self.layout = layout
+            return frame
+
+        img_arr = np.frombuffer(response.content, np.uint8)
+        frame = cv2.imdecode(img_arr, cv2.IMREAD_COLOR)
+        if frame is not None and self.preprocess is not None:
+            frame = self.preprocess(frame)
+        return frame
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                frame = self._fetch()
+            except requests.exceptions.RequestException as e:
+                print(f"grabber exception occured\n{e}")
+                frame = None
+
+            if frame is not None:
+                self._publish(frame, self._last_content)
+
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _take_canvas(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        w, h = self.letterboxer.target_size
+        return np.empty((h, w, 3), dtype=np.uint8)
+
+    def _release(self, canvas):
+        with self._lock:
+            self._free.append(canvas)
+
+    def _publish(self, frame, payload):
+        with self._lock:  # only the newest frame is kept
+            previous, handed_out = self._frame, self._handed_out
+            self._frame = frame
+            self._payload = payload
+            self._timestamp = time.time()
+            self._handed_out = False
+            # a frame nobody took is reused; one handed out now belongs to its caller
+            if self.letterboxer is not None and previous is not None and not handed_out:
+                self._free.append(previous)
+
+    def latest(self):
+        """
+        Return (frame, timestamp, stale) without blocking on the network.
+        frame is None until the first shot arrives.
+        """
+        frame, payload, timestamp, stale = self.snapshot()
+        return frame, timestamp, stale
+
+    def snapshot(self):
+        """
+        Return (frame, payload, timestamp, stale) of the same shot, payload being its JPEG bytes.
+        """
+        with self._lock:
+            frame, payload, timestamp = self._frame, self._payload, self._timestamp
+            self._handed_out = frame is not None
+        stale = frame is None or (time.time() - timestamp) > self.max_age
+        return frame, payload, timestamp, stale
@@ -0,0 +1,155 @@
+import queue
+import time
+import tkinter as tk
+from tkinter import ttk
+
+import cv2
+import numpy as np
+
+import metrics
+
+
+class UIBridge:
+    """
+    Hands updates from worker threads to Tk.
+    Workers call post(kind, payload) which never blocks; the Tk thread drains
+    the queue every refresh_ms with root.after and applies only the newest
+    payload of each kind, so bursts of updates never pile up.
+    """
+
+    def __init__(self, root, refresh_ms=100, max_queue=256):
+        self.root = root
+        self.refresh_ms = refresh_ms
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.handlers = {}
+        self.dropped = 0
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def post(self, kind, payload=None):
+        try:
+            self.queue.put_nowait((kind, payload))
+        except queue.Full:
+            # drop the oldest update, the newest one is the one worth showing
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped += 1
+            try:
+                self.queue.put_nowait((kind, payload))
+            except queue.Full:
+                pass
+
+    def _poll(self):
+        latest = {}
+        while True:
+            try:
+                kind, payload = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            latest.pop(kind, None)  # keep arrival order of the newest update per kind
+            latest[kind] = payload
+
+        for kind, payload in latest.items():
+            handler = self.handlers.get(kind)
+            if handler is not None:
+                try:
+                    handler(payload)
+                except Exception as e:
+                    print(f"GUI update '{kind}' failed\n{e}")
+        self.root.after(self.refresh_ms, self._poll)
+
+    def start(self):
+        self.root.after(self.refresh_ms, self._poll)
+        return self
+
+
+class PreviewSink:
+    """
+    Result sink for ai_module.set_headless(): forwards inference results
+    to the bridge; drawing happens later on the Tk thread.
+    """
+
+    def __init__(self, bridge):
+        self.bridge = bridge
+
+    def submit(self, result):
+        self.bridge.post("preview", result)
+        return True
+
+
+class PreviewPanel:
+    """
+    Shows the newest annotated frame with lane overlays and per-stage timings,
+    redrawn at most max_fps times per second.
+    store -> LaneStore read on every draw, so edited lanes show up without a restart.
+    roi(lanes) -> (x0, y0, x1, y1) crop the results were inferred on, or None for the full frame.
+    """
+
+    STAGES = ("grab", "capture", "inference", "lane_assignment", "serial_write", "cycle", "preemption")
+
+    def __init__(self, parent, lanes=None, size=(320, 320), max_fps=4, store=None, roi=None):
+        self.lanes = lanes
+        self.store = store
+        self.roi = roi
+        self.size = size
+        self.min_interval = 1.0 / max_fps
+        self._last_draw = 0.0
+        self._photo = None  # keep a reference or Tk drops the image
+        self._pending = None
+        self._scheduled = False
+
+        self.image_label = ttk.Label(parent)
+        self.image_label.pack(pady=(10, 0))
+        self.timing_label = ttk.Label(parent, text="", font=('Courier', 9), justify=tk.LEFT)
+        self.timing_label.pack()
+
+    def show(self, result):
+        if result is None:
+            return
+        now = time.monotonic()
+        wait = self.min_interval - (now - self._last_draw)
+        if wait > 0:
+            # throttled: remember only the newest result and draw it once the interval has passed
+            self._pending = result
+            if not self._scheduled:
+                self._scheduled = True
+                self.image_label.after(int(wait * 1000) + 1, self._draw_pending)
+            return
+        self._last_draw = now
+
+        frame = result.plot() if hasattr(result, "plot") else np.array(result)  # both give a new array to draw on
+        lanes = self.store.get() if self.store is not None else self.lanes
+        if lanes is not None:
+            offset = (0, 0)
+            roi = self.roi(lanes) if self.roi is not None else None
+            if roi is not None and frame.shape[:2] == (roi[3] - roi[1], roi[2] - roi[0]):
+                offset = (roi[0], roi[1])  # the result is the lane crop, lanes are in full frame coordinates
+            for i, lane in enumerate(lanes):
+                pts = (np.asarray(lane, dtype=np.int32) - offset).reshape((-1, 1, 2))
+                cv2.polylines(frame, [pts], True, (0, 255, 0), 2)
+                x, y = pts[0, 0]
+                cv2.putText(frame, f"L{i + 1}", (int(x), int(y)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        ok, ppm = cv2.imencode(".ppm", small)  # PPM is read by Tk without PIL
+        if ok:
+            self._photo = tk.PhotoImage(data=ppm.tobytes(), format="PPM")
+            self.image_label.configure(image=self._photo)
+        self.show_timings()
+
+    def _draw_pending(self):
+        self._scheduled = False
+        result, self._pending = self._pending, None
+        self.show(result)
+
+    def show_timings(self):
+        values = metrics.snapshot()
+        rows = []
+        for stage in self.STAGES:
+            item = values.get(f"{metrics.PREFIX}{stage}_seconds")
+            if item and item.get("last") is not None:
+                rows.append(f"{stage:<16}{item['last'] * 1000:>8.1f} ms")
+        self.timing_label['text'] = "\n".join(rows)
@@ -0,0 +1,136 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+import metrics
+
+# Quality levels from best to cheapest. Each level may lower the input size,
+# skip frames (reuse the last counts) or switch to lighter weights.
+DEFAULT_LEVELS = (
+    {"name": "full", "imgsz": 640},
+    {"name": "imgsz-512", "imgsz": 512},
+    {"name": "imgsz-416", "imgsz": 416},
+    {"name": "imgsz-320", "imgsz": 320},
+    {"name": "imgsz-320-skip", "imgsz": 320, "skip": 1},
+)
+
+
+class InferenceGovernor:
+    """
+    Keeps detect_cars inside the per-cycle deadline.
+
+    The ESP32 only waits a few seconds for a plan after "Ready", so when the
+    recent inference latency gets close to `deadline` the governor steps down
+    one level, and after `patience` comfortable frames it steps back up.
+    """
+
+    def __init__(self, deadline=2.5, levels=DEFAULT_LEVELS, window=8, high_water=0.8, low_water=0.4,
+                 patience=10, percentile=90, load_model=None):
+        self.deadline = deadline          # seconds available for inference in one cycle
+        self.levels = list(levels)
+        self.high_water = high_water      # step down when p(latency) > deadline * high_water
+        self.low_water = low_water        # step up when p(latency) < deadline * low_water ...
+        self.patience = patience          # ... for this many frames in a row
+        self.percentile = percentile
+        self.load_model = load_model      # weights -> model, used by levels with "weights"
+
+        self.level = 0
+        self.last_counts = None
+        self.switches = 0
+        self._latencies = deque(maxlen=window)
+        self._comfortable = 0
+        self._skipped = 0
+        self._models = {}       # weights -> loaded model, filled by preload()
+        self._loader = None
+
+    @property
+    def current(self):
+        return self.levels[self.level]
+
+    @property
+    def imgsz(self):
+        return self.current.get("imgsz")
+
+    def preload(self, background=True):
+        """
+        Load the weights of every level up front, so stepping down never
+        loads a model inside detect_cars. Levels switch only once loaded.
+        """
+        if self.load_model is None or (self._loader is not None and self._loader.is_alive()):
+            return self._loader
+
+        def run():
+            for level in self.levels:
+                weights = level.get("weights")
+                if weights is None or weights in self._models:
+                    continue
+                try:
+                    self._models[weights] = self.load_model(weights)
+                except Exception as e:
+                    print(f"inference governor: failed to load {weights}\n{e}")
+                    continue
+                print(f"inference governor: {weights} loaded")
+
+        if not background:
+            run()
+            return None
+        self._loader = threading.Thread(target=run, daemon=True, name="governor-preload")
+        self._loader.start()
+        return self._loader
+
+    def loaded(self, level):
+        weights = self.levels[level].get("weights")
+        return weights is None or self.load_model is None or weights in self._models
+
+    def model_for_level(self, default_model):
+        weights = self.current.get("weights")
+        if weights is None or self.load_model is None:
+            return default_model
+        return self._models.get(weights, default_model)
+
+    def should_skip(self):
+        """
+        True when this frame should reuse last_counts instead of running inference.
+        """
+        skip = self.current.get("skip", 0)
+        if not skip or self.last_counts is None:
+            return False
+        if self._skipped < skip:
+            self._skipped += 1
+            metrics.inc("governor_skipped_total")
+            return True
+        self._skipped = 0
+        return False
+
+    def record(self, latency, counts=None):
+        if counts is not None:
+            self.last_counts = counts
+        self._latencies.append(latency)
+        recent = np.percentile(self._latencies, self.percentile)
+
+        if recent > self.deadline * self.high_water and self.level < len(self.levels) - 1:
+            if self.loaded(self.level + 1):
+                self._switch(self.level + 1, recent)
+            else:
+                self.preload()  # lighter weights still loading, step down once they are in
+        elif recent < self.deadline * self.low_water and self.level > 0:
+            self._comfortable += 1
+            if self._comfortable >= self.patience and self.loaded(self.level - 1):
+                self._switch(self.level - 1, recent)
+        else:
+            self._comfortable = 0
+
+    def _switch(self, level, recent):
+        previous = self.current["name"]
+        direction = "down" if level > self.level else "up"
+        self.level = level
+        self.switches += 1
+        self._comfortable = 0
+        self._skipped = 0
+        self._latencies.clear()  # judge the new level on its own latency
+        print(f"inference governor: {previous} -> {self.current['name']} "
+              f"(p{self.percentile} {recent * 1000:.0f} ms, deadline {self.deadline * 1000:.0f} ms)")
+        metrics.inc("governor_switches_total")
+        metrics.log_event("governor_switch", direction=direction, previous=previous, level=self.current["name"],
+                          latency_ms=round(recent * 1000, 1), deadline_ms=self.deadline * 1000)
@@ -0,0 +1,145 @@
+"""
+Lane polygons on disk and in memory.
+
+Lanes are stored as JSON:
+
+    {"version": 1, "camera_id": "172.20.10.2:8080", "size": [640, 640],
+     "lanes": [[[x, y], ...], ...]}
+
+LaneStore keeps the parsed polygons in memory and only re-reads the file
+when its mtime changes, so a cycle costs one os.stat at most and editing
+lanes.json takes effect without a restart. An old pickled lanes.npy is
+converted once on first use.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 1
+LANES_FILE = "lanes.json"
+LEGACY_FILE = "lanes.npy"
+
+
+def to_polygons(lanes):
+    return [np.asarray(lane, dtype=np.int32).reshape(-1, 2) for lane in lanes]
+
+
+def save_lanes(lanes, path=LANES_FILE, camera_id=None, size=(640, 640)):
+    data = {"version": FORMAT_VERSION, "camera_id": camera_id, "size": list(size),
+            "lanes": [polygon.tolist() for polygon in to_polygons(lanes)]}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)  # readers never see a half-written file
+
+
+def load_lanes(path=LANES_FILE):
+    """
+    Returns (lanes, meta) where meta holds version, camera_id and size.
+    Raises ValueError on an unknown version or malformed polygons.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != FORMAT_VERSION:
+        raise ValueError(f"unsupported lane file version {data.get('version')}")
+    lanes = to_polygons(data["lanes"])
+    if any(len(polygon) < 3 for polygon in lanes):
+        raise ValueError("every lane needs at least 3 points")
+    meta = {key: data.get(key) for key in ("version", "camera_id", "size")}
+    return lanes, meta
+
+
+def migrate_legacy(legacy_path=LEGACY_FILE, path=LANES_FILE, camera_id=None):
+    """
+    Convert a lanes.npy written by older versions. The ragged array was saved
+    with pickle, so this is the only place that still unpickles, once.
+    """
+    lanes = np.load(legacy_path, allow_pickle=True)
+    save_lanes(lanes, path, camera_id)
+    print(f"Converted {legacy_path} to {path}.")
+
+
+class LaneStore:
+    def __init__(self, path=LANES_FILE, legacy_path=LEGACY_FILE, camera_id=None, check_interval=1.0):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.camera_id = camera_id
+        self.check_interval = check_interval  # seconds between mtime checks
+        self.lanes = None
+        self.meta = None
+        self.mtime = None
+        self.reloads = 0
+        self._checked = 0.0
+
+    def exists(self):
+        return os.path.exists(self.path) or (self.legacy_path is not None and os.path.exists(self.legacy_path))
+
+    def get(self):
+        """
+        Cached lanes, re-read only when the file changed. None if there is no lane file.
+        """
+        now = time.monotonic()
+        if self.lanes is not None and now - self._checked < self.check_interval:
+            return self.lanes
+        self._checked = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            if self.legacy_path is None or not os.path.exists(self.legacy_path):
+                return self.lanes
+            migrate_legacy(self.legacy_path, self.path, self.camera_id)
+            mtime = os.stat(self.path).st_mtime_ns
+
+        if mtime != self.mtime:
+            try:
+                lanes, meta = load_lanes(self.path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Failed to load {self.path}, keeping the previous lanes\n{e}")
+                return self.lanes
+            if self.lanes is not None:
+                print(f"Lanes reloaded from {self.path}.")
+            self.lanes, self.meta, self.mtime = lanes, meta, mtime
+            self.reloads += 1
+        return self.lanes
+
+    def save(self, lanes):
+        save_lanes(lanes, self.path, self.camera_id)
+        self.mtime = None  # pick up the new file on the next get()
+        self._checked = 0.0
+        return self.get()
+
+
+_stores = {}
+
+
+def get_store(path=LANES_FILE, **options):
+    """
+    One shared LaneStore per file. Later calls fill in options the first
+    caller left unset (e.g. camera_id); a conflicting value raises ValueError.
+    """
+    store = _stores.get(path)
+    if store is None:
+        store = _stores[path] = LaneStore(path, **options)
+        return store
+    for key, value in options.items():
+        current = getattr(store, key)
+        if value is None or value == current:
+            continue
+        if current is not None:
+            raise ValueError(f"{path} is already open with {key}={current!r}, not {value!r}")
+        setattr(store, key, value)
+    return store
+
+
+def read_lanes(path):
+    """
+    Lanes from a .json lane file, or from an old .npy (converted next to it).
+    """
+    if path.endswith(".npy"):
+        json_path = path[:-4] + ".json"
+        return get_store(json_path, legacy_path=path).get()
+    return get_store(path, legacy_path=None).get()
@@ -0,0 +1,186 @@
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Lightweight counters and latency histograms for the controller.
+# Recording is a lock + a few additions, cheap enough to leave on in production.
+# Exposed in Prometheus text format on a local HTTP endpoint and as JSON log lines.
+
+PREFIX = "traffic_"
+
+# seconds, covers serial writes (ms) up to full signal cycles (tens of seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+logger = logging.getLogger("traffic.metrics")
+
+def _header(metric):
+    return [f"# HELP {metric.name} {metric.help}"] if metric.help else []
+
+class Counter:
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return _header(self) + [f"# TYPE {self.name} counter", f"{self.name} {self.value}"]
+
+class Histogram:
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.last = None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+            self.last = value
+
+    def render(self):
+        lines = _header(self) + [f"# TYPE {self.name} histogram"]
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+_metrics = {}
+_registry_lock = threading.Lock()
+
+def counter(name, help=""):
+    name = PREFIX + name
+    metric = _metrics.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _metrics.setdefault(name, Counter(name, help))
+    return metric
+
+def histogram(name, help="", buckets=DEFAULT_BUCKETS):
+    name = PREFIX + name + "_seconds"
+    metric = _metrics.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _metrics.setdefault(name, Histogram(name, help, buckets))
+    return metric
+
+def observe(name, seconds):
+    histogram(name).observe(seconds)
+
+def inc(name, amount=1):
+    counter(name).inc(amount)
+
+class _Timer:
+    __slots__ = ("hist", "start", "elapsed")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.start
+        self.hist.observe(self.elapsed)
+        return False
+
+def timer(name, help=""):
+    """
+    with metrics.timer("inference"): ...
+    """
+    return _Timer(histogram(name, help))
+
+def timed(name, help=""):
+    """
+    Decorator version of timer().
+    """
+    def decorator(func):
+        hist = histogram(name, help)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def render():
+    with _registry_lock:
+        metrics = list(_metrics.values())
+    lines = []
+    for metric in sorted(metrics, key=lambda m: m.name):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def snapshot():
+    """
+    Compact dict of current values, used for structured log lines.
+    """
+    with _registry_lock:
+        metrics = list(_metrics.values())
+    data = {}
+    for metric in metrics:
+        if isinstance(metric, Counter):
+            data[metric.name] = metric.value
+        elif metric.count:
+            data[metric.name] = {"count": metric.count, "mean": metric.sum / metric.count, "last": metric.last}
+    return data
+
+def log_event(event, **fields):
+    """
+    One JSON line per event on the traffic.metrics logger.
+    """
+    if logger.isEnabledFor(logging.INFO):
+        fields["event"] = event
+        fields["ts"] = round(time.time(), 3)
+        logger.info(json.dumps(fields, default=str))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_http_server(port=9100, host="127.0.0.1"):
+    """
+    Serve /metrics in Prometheus text format on a daemon thread.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
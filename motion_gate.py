@@ -0,0 +1,90 @@
+import hashlib
+import time
+
+import cv2
+import numpy as np
+
+import metrics
+
+
+class MotionGate:
+    """
+    Cheap pre-inference check that skips YOLO when nothing changed.
+
+    1. hash of the JPEG payload -> catches the camera repeating the same shot
+    2. downsampled grayscale difference against the last inferred frame,
+       counted only inside the lane polygons
+
+    When neither shows change the last lane counts are reused.
+    Inference is forced at least every force_interval seconds.
+    """
+
+    def __init__(self, pixel_threshold=25, changed_fraction=0.02, force_interval=30.0, grid=(80, 80)):
+        self.pixel_threshold = pixel_threshold    # per-pixel gray level difference that counts as change
+        self.changed_fraction = changed_fraction  # share of lane pixels that must change
+        self.force_interval = force_interval      # seconds, re-infer even if the scene looks static
+        self.grid = grid                          # downsampled size used for differencing
+
+        self.last_counts = None
+        self.hits = 0       # inference skipped
+        self.misses = 0     # inference ran
+        self._last_hash = None
+        self._reference = None
+        self._last_inference = 0.0
+        self._mask = None
+        self._mask_key = None
+
+    def _lane_mask(self, lanes, frame_shape):
+        lanes = [] if lanes is None else lanes
+        key = (frame_shape[:2], tuple(np.asarray(lane, dtype=np.int32).tobytes() for lane in lanes))
+        if key != self._mask_key:
+            if len(lanes) == 0:
+                self._mask = None
+            else:
+                full = np.zeros(frame_shape[:2], dtype=np.uint8)
+                cv2.fillPoly(full, [np.asarray(lane, dtype=np.int32).reshape((-1, 1, 2)) for lane in lanes], 1)
+                self._mask = cv2.resize(full, self.grid, interpolation=cv2.INTER_NEAREST).astype(bool)
+                if not self._mask.any():
+                    self._mask = None
+            self._mask_key = key
+        return self._mask
+
+    def _small_gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, self.grid, interpolation=cv2.INTER_AREA)
+
+    def should_infer(self, frame, payload=None, lanes=None):
+        if frame is None:
+            return True  # let the normal pipeline report the missing frame
+
+        now = time.monotonic()
+        payload_hash = hashlib.blake2b(payload, digest_size=8).digest() if payload is not None else None
+        small = self._small_gray(frame)
+
+        changed = True
+        if self.last_counts is not None and now - self._last_inference < self.force_interval:
+            if payload_hash is not None and payload_hash == self._last_hash:
+                changed = False  # identical JPEG, the camera sent a stale shot
+            elif self._reference is not None:
+                diff = cv2.absdiff(small, self._reference) > self.pixel_threshold
+                mask = self._lane_mask(lanes, frame.shape)
+                fraction = diff[mask].mean() if mask is not None else diff.mean()
+                changed = fraction >= self.changed_fraction
+        self._last_hash = payload_hash
+
+        if changed:
+            self.misses += 1
+            metrics.inc("gate_inferred_total")
+            self._reference = small
+            self._last_inference = now
+        else:
+            self.hits += 1
+            metrics.inc("gate_skipped_total")
+        return changed
+
+    def update(self, counts):
+        self.last_counts = counts
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"skipped": self.hits, "inferred": self.misses, "skip_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,260 @@
+"""
+Runs many intersections from one process.
+
+All ESP32 serial links are multiplexed on one asyncio event loop and all
+cameras share one pool of inference workers, so memory and CPU grow with
+the total frame rate instead of the number of intersections.
+
+    python orchestrator.py intersections.json
+
+Example config:
+
+    {
+      "weights": "best.pt",
+      "backend": "pytorch",
+      "inference_workers": 1,
+      "max_batch": 8,
+      "metrics_port": 9100,
+      "intersections": [
+        {
+          "name": "main-and-5th",
+          "serial_port": "COM3",
+          "lane_file": "lanes.json",
+          "cameras": [{"ip": "172.20.10.2", "port": 8080}],
+          "max_capacity": [2, 3, 2, 3],
+          "lane_weights": [1.2, 1, 1.2, 1]
+        }
+      ]
+    }
+"""
+
+import asyncio
+import json
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+import serial
+
+import metrics
+from ai_module import CONTROLLER_LANES, extract_boxes, get_lane_counts
+from lane_config import get_store
+from async_controller import PipelinedController
+from detector_backends import load_detector
+from frame_grabber import FrameGrabber
+from preprocess import Letterboxer
+from traffic_logic import lane_weights, max_capacity
+
+
+def _set_result(future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+class InferencePool:
+    """
+    Worker threads that each own one detector and serve lane-count requests
+    from every intersection, batching whatever is queued into one model call.
+    """
+
+    def __init__(self, weights="best.pt", backend="pytorch", workers=1, max_batch=8, max_wait=0.01, int8=False):
+        self.weights = weights
+        self.backend = backend
+        self.int8 = int8
+        self.max_batch = max_batch
+        self.max_wait = max_wait  # seconds to wait for more requests before running a partial batch
+        self._requests = queue.Queue()
+        self.ready = threading.Event()  # set once a worker has loaded and warmed up its detector
+        self._threads = [threading.Thread(target=self._worker, daemon=True, name=f"inference-{i}")
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def _next_batch(self):
+        first = self._requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._requests.put(None)  # let the stop reach this worker's next loop
+                break
+            batch.append(item)
+        return batch
+
+    def _worker(self):
+        model = load_detector(self.backend, self.weights, int8=self.int8)
+        model(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)  # warmup, the first call is the slow one
+        self.ready.set()
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            frames = [item[0] for item in batch]
+            started = time.perf_counter()
+            try:
+                results = model(frames, verbose=False)  # one call for every queued frame
+            except Exception as e:
+                print(f"Exception occurred during batch inference\n{e}")
+                results = [None] * len(batch)
+            metrics.observe("batch_inference", time.perf_counter() - started)
+
+            for (frame, lanes, future, loop), result in zip(batch, results):
+                boxes = extract_boxes(result) if result is not None else None
+                counts = get_lane_counts(boxes, lanes) if result is not None else None
+                loop.call_soon_threadsafe(_set_result, future, counts)
+
+    async def count_lanes(self, frame, lanes):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._requests.put((frame, lanes, future, loop))  # grabber frames are never recycled, no copy needed
+        return await future
+
+    def stop(self):
+        for _ in self._threads:
+            self._requests.put(None)
+
+
+class Intersection(PipelinedController):
+    """
+    PipelinedController whose perception goes through the shared InferencePool
+    and whose serial port is read by the event loop itself where supported.
+    """
+
+    def __init__(self, config, pool, ser):
+        capacity = config.get("max_capacity", max_capacity)
+        super().__init__(ser, get_counts=None, name=config["name"], num_lanes=len(capacity),
+                         weights=config.get("lane_weights", lane_weights), capacity=capacity,
+                         max_plan_age=config.get("max_plan_age", 15.0),
+                         min_perception_interval=config.get("perception_interval", 1.0), ready=pool.ready.is_set)
+        self.pool = pool
+        self.grabbers = []
+        self.lane_stores = []
+        for camera in config["cameras"]:
+            lane_file = camera.get("lane_file", config.get("lane_file", "lanes.json"))
+            store = get_store(lane_file, legacy_path=lane_file[:-5] + ".npy" if lane_file.endswith(".json") else None,
+                              camera_id=f"{camera['ip']}:{camera['port']}")
+            if store.get() is None:
+                raise ValueError(f"{config['name']}: no lanes in {lane_file}")
+            self.lane_stores.append(store)
+
+        # lanes are numbered camera by camera, the ESP32 drives exactly CONTROLLER_LANES of them
+        total = sum(len(store.get()) for store in self.lane_stores)
+        if not total == len(capacity) == len(self.weights) == CONTROLLER_LANES:
+            raise ValueError(f"{config['name']}: {total} lanes over {len(self.lane_stores)} camera(s), "
+                             f"{len(capacity)} capacities and {len(self.weights)} weights, "
+                             f"the controller needs {CONTROLLER_LANES} of each")
+        for camera in config["cameras"]:
+            self.grabbers.append(FrameGrabber(camera["ip"], camera["port"], letterboxer=Letterboxer(buffers=1)).start())
+
+    async def perception_loop(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                await self._perceive()
+            except Exception as e:  # stays inside this intersection, the others keep running
+                print(f"Exception occurred during perception [{self.name}]\n{e}")
+                metrics.inc("perception_errors_total")
+
+            delay = self.min_perception_interval - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _perceive(self):
+        frames = [grabber.latest() for grabber in self.grabbers]
+        # until the pool is warm current_plan() serves fixed-time plans
+        if not (self.ready() and frames and all(not stale for frame, timestamp, stale in frames)):
+            return
+        lanes_per_camera = [store.get() for store in self.lane_stores]  # cached, re-read when edited
+        per_camera = await asyncio.gather(*(self.pool.count_lanes(frame, lanes)
+                                            for (frame, timestamp, stale), lanes in zip(frames, lanes_per_camera)))
+        if any(counts is None for counts in per_camera):
+            return
+        # one camera per approach, lanes are numbered camera by camera
+        counts = [count for counts in per_camera for count in counts]
+        if len(counts) != self.num_lanes:
+            print(f"lane files now give {len(counts)} lanes [{self.name}], expected {self.num_lanes}")
+            return
+        self.car_counts = counts
+        self.counts_time = min(timestamp for frame, timestamp, stale in frames)
+        self._update_plan()
+
+    async def serial_loop(self):
+        loop = asyncio.get_running_loop()
+        try:
+            fd = self.ser.fileno()
+            readable = asyncio.Event()
+            loop.add_reader(fd, readable.set)
+        except (AttributeError, NotImplementedError, ValueError):
+            # Windows COM ports / proactor loop: fall back to a blocking reader thread
+            await super().serial_loop()
+            return
+
+        buffer = bytearray()
+        try:
+            while not self._stop.is_set():
+                await readable.wait()
+                readable.clear()
+                buffer.extend(self.ser.read(self.ser.in_waiting or 1))
+                while True:
+                    end = buffer.find(b"\n")
+                    if end < 0:
+                        break
+                    line = buffer[:end].decode(errors="ignore").strip()
+                    del buffer[:end + 1]
+                    if line:
+                        self.process_line(line)
+        finally:
+            loop.remove_reader(fd)
+
+    def stop(self):
+        super().stop()
+        for grabber in self.grabbers:
+            grabber.stop()
+
+
+async def run(config):
+    pool = InferencePool(config.get("weights", "best.pt"), config.get("backend", "pytorch"),
+                         workers=config.get("inference_workers", 1), max_batch=config.get("max_batch", 8),
+                         int8=config.get("int8", False))
+    intersections = []
+    for item in config["intersections"]:
+        ser = serial.Serial(item["serial_port"], item.get("baud", 9600), timeout=1)
+        intersections.append(Intersection(item, pool, ser))
+    print(f"Driving {len(intersections)} intersections with {len(pool._threads)} inference worker(s).")
+
+    try:
+        await asyncio.gather(*(intersection.run() for intersection in intersections))
+    finally:
+        for intersection in intersections:
+            intersection.stop()
+        pool.stop()
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("usage: python orchestrator.py <config.json>")
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        config = json.load(f)
+
+    if config.get("metrics_port"):
+        metrics.start_http_server(config["metrics_port"])
+    try:
+        asyncio.run(run(config))
+    except KeyboardInterrupt:
+        print("Stopping orchestrator.")
+
+
+if __name__ == "__main__":
+    main()
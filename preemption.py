@@ -0,0 +1,74 @@
+"""
+Priority path for emergency vehicles.
+
+The ESP32 pushes "Emerg,<lane>,<phase>,<ms since the IR edge>" as soon as an
+IR sensor fires, runs the emergency green and then waits briefly for a plan
+covering the lanes it has not served yet. PreemptionHandler answers with
+that plan on its own thread, so it never waits behind a cycle in progress or
+for the next "Ready".
+"""
+
+import queue
+import threading
+import time
+
+import metrics
+from traffic_logic import lane_weights, parse_emergency_line, remaining_plan
+
+
+class PreemptionHandler:
+    def __init__(self, plan_sender, weights=lane_weights, recorder=None, on_preempt=None):
+        self.plan_sender = plan_sender  # PlanSender shared with the normal cycle
+        self.weights = weights
+        self.recorder = recorder
+        self.on_preempt = on_preempt    # on_preempt(lane, replan or None), e.g. to update a GUI
+        self.plan = None                # (lane_order, lane_times, counts) the ESP32 is running
+        self.preemptions = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True, name="preemption").start()
+
+    def set_plan(self, lane_order, lane_times, counts):
+        self.plan = (list(lane_order), list(lane_times), list(counts))
+
+    def submit(self, reading):
+        """
+        SerialReader priority hook for "Emerg" readings, never blocks the reader.
+        """
+        self._queue.put(reading)
+
+    def _run(self):
+        while True:
+            reading = self._queue.get()
+            try:
+                self.handle(reading.line, reading.ts)
+            except Exception as e:
+                print(f"Exception occurred during emergency preemption\n{e}")
+
+    def handle(self, line, received=None):
+        received = time.time() if received is None else received
+        lane, phase, firmware_ms = parse_emergency_line(line)
+        self.preemptions += 1
+        metrics.inc("emergency_total")
+        print(f"EMERGENCY on lane {lane + 1}, preempting phase {phase + 1}")
+
+        replan = None
+        if self.plan is not None:
+            lane_order, lane_times, counts = self.plan
+            replan = remaining_plan(counts, lane_order, lane_times, phase, lane, self.weights)
+        if replan is not None:
+            if self.plan_sender.send(*replan):
+                self.plan = (replan[0], replan[1], counts)
+            else:
+                print("ESP32 did not acknowledge the emergency replan.")
+                metrics.inc("ready_missed_total")
+            if self.recorder is not None:
+                self.recorder.record_plan(replan[0], replan[1], counts, replan=True)
+
+        # IR edge -> remaining plan acknowledged (or handled, when nothing was left to replan)
+        latency = firmware_ms / 1000 + (time.time() - received)
+        metrics.observe("preemption", latency)
+        metrics.log_event("preemption", lane=lane, phase=phase, latency_ms=round(latency * 1000, 1),
+                          order=replan[0] if replan else None, times=replan[1] if replan else None)
+        if self.on_preempt is not None:
+            self.on_preempt(lane, replan)
+        return replan
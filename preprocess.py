@@ -0,0 +1,146 @@
+import weakref
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# scale/padding for one source resolution, reduce -> JPEG decode reduction factor (1, 2, 4, 8)
+LetterboxLayout = namedtuple("LetterboxLayout", "src_w src_h scale new_w new_h left top reduce")
+
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# JPEG start-of-frame markers that carry the image size
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data):
+    """
+    Read (width, height) from the JPEG header without decoding.
+    Returns None if the header cannot be parsed.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # markers without a length
+            i += 2
+            continue
+        length = (data[i + 2] << 8) | data[i + 3]
+        if marker in _SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+
+class Letterboxer:
+    """
+    Fused JPEG decode + letterbox into preallocated target_size canvases.
+    Canvases are reused round-robin, so a returned frame stays valid
+    only until `buffers` more frames have been produced, unless the caller
+    passes its own canvas as `out`.
+    """
+
+    def __init__(self, target_size=(640, 640), color=(0, 0, 0), buffers=2):
+        self.target_size = target_size
+        self.color = color
+        w, h = target_size
+        self.canvases = [np.empty((h, w, 3), dtype=np.uint8) for _ in range(max(1, buffers))]
+        self._canvas_layout = [None] * len(self.canvases)  # layout last drawn on each canvas
+        self._out_layout = {}  # id -> (weakref, layout) for caller-owned canvases
+        self._next = 0
+        self._layouts = {}
+        self._resized = {}  # resize output buffer per layout
+
+    def layout(self, src_w, src_h):
+        key = (src_w, src_h)
+        layout = self._layouts.get(key)
+        if layout is None:
+            target_w, target_h = self.target_size
+            scale = min(target_w / src_w, target_h / src_h)
+            new_w = int(src_w * scale)
+            new_h = int(src_h * scale)
+
+            # largest decode reduction that still keeps at least the letterbox size
+            reduce = 1
+            for r in (8, 4, 2):
+                if -(-src_w // r) >= new_w and -(-src_h // r) >= new_h:
+                    reduce = r
+                    break
+
+            layout = LetterboxLayout(src_w, src_h, scale, new_w, new_h,
+                                     (target_w - new_w) // 2, (target_h - new_h) // 2, reduce)
+            self._layouts[key] = layout
+        return layout
+
+    def decode(self, data, out=None):
+        """
+        Decode JPEG bytes straight into a letterboxed canvas, or into out
+        (a target_size canvas owned by the caller) when given.
+        Returns (frame, layout) or (None, None) if decoding failed.
+        """
+        buf = np.frombuffer(data, np.uint8)  # no copy of the response bytes
+        size = jpeg_size(data)
+        flag = _REDUCED_FLAGS[self.layout(*size).reduce] if size else cv2.IMREAD_COLOR
+
+        image = cv2.imdecode(buf, flag)
+        if image is None:
+            return None, None
+        if size is None:
+            size = (image.shape[1], image.shape[0])
+        return self.letterbox(image, size, out)
+
+    def letterbox(self, image, src_size=None, out=None):
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        h, w = image.shape[:2]
+        layout = self.layout(*(src_size or (w, h)))
+
+        if out is None:
+            index = self._next
+            self._next = (index + 1) % len(self.canvases)
+            canvas = self.canvases[index]
+            painted = self._canvas_layout[index]
+            self._canvas_layout[index] = layout
+        else:
+            canvas = out
+            ref, painted = self._out_layout.get(id(out), (None, None))
+            if ref is None or ref() is not out:  # new canvas, or a freed one's id reused
+                painted = None
+            self._out_layout[id(out)] = (weakref.ref(out), layout)
+        if painted != layout:  # padding only needs repainting when the layout changes
+            canvas[...] = self.color
+
+        region = canvas[layout.top:layout.top + layout.new_h, layout.left:layout.left + layout.new_w]
+        if (w, h) == (layout.new_w, layout.new_h):
+            region[...] = image
+        else:
+            buf = self._resized.get(layout)
+            if buf is None:
+                buf = np.empty((layout.new_h, layout.new_w, 3), dtype=np.uint8)
+                self._resized[layout] = buf
+            region[...] = cv2.resize(image, (layout.new_w, layout.new_h), dst=buf, interpolation=cv2.INTER_LINEAR)
+        return canvas, layout
+
+
+def to_source_coords(points, layout):
+    """
+    Map (x, y) points from letterboxed frame coordinates back to the source image.
+    """
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    offset = np.array([layout.left, layout.top], dtype=np.float32)
+    return (points - offset) / layout.scale
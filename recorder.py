@@ -0,0 +1,266 @@
+"""
+Append-only recording of everything a cycle depends on, and a replayer.
+
+A recording is a folder with
+    meta.json          format version and camera id
+    chunk_00000.bin    raw payloads back to back (JPEG bytes, serial lines, plans)
+    index.bin          one fixed-size INDEX_DTYPE record per payload
+
+The index is read with np.memmap and the chunks with mmap, so a replay
+never parses or copies more than the records it actually uses.
+
+    python recorder.py recordings/2026-10-17 --speed 0
+"""
+
+import argparse
+import json
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+FRAME = 1       # JPEG bytes from the camera
+ULTRA = 2       # "Ultra,L1,..." line from the ESP32
+EMERGENCY = 3   # IR emergency event line from the ESP32
+PLAN = 4        # JSON plan that was sent: order, times, counts, replan (remaining lanes after an emergency)
+
+KIND_NAMES = {FRAME: "frame", ULTRA: "ultra", EMERGENCY: "emergency", PLAN: "plan"}
+
+INDEX_DTYPE = np.dtype([("ts", "<f8"), ("kind", "u1"), ("chunk", "<u4"), ("offset", "<u8"), ("length", "<u4")])
+
+
+class Recorder:
+    def __init__(self, path, chunk_size=256 * 1024 * 1024, camera_id=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            with open(meta_path, "w") as f:
+                json.dump({"version": FORMAT_VERSION, "created": time.time(), "camera_id": camera_id}, f)
+
+        # continue an existing recording instead of overwriting it
+        self._index = open(os.path.join(path, "index.bin"), "ab")
+        self._chunk_id = 0
+        while os.path.exists(self._chunk_path(self._chunk_id + 1)):
+            self._chunk_id += 1
+        self._chunk = open(self._chunk_path(self._chunk_id), "ab")
+        self._offset = self._chunk.tell()
+
+    def _chunk_path(self, chunk_id):
+        return os.path.join(self.path, f"chunk_{chunk_id:05d}.bin")
+
+    def record(self, kind, payload, ts=None):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        with self._lock:
+            if self._offset + len(payload) > self.chunk_size and self._offset > 0:
+                self._chunk.close()
+                self._chunk_id += 1
+                self._chunk = open(self._chunk_path(self._chunk_id), "ab")
+                self._offset = 0
+            self._chunk.write(payload)
+            entry[0] = (time.time() if ts is None else ts, kind, self._chunk_id, self._offset, len(payload))
+            self._offset += len(payload)
+            self._index.write(entry.tobytes())
+
+    def record_frame(self, jpeg_bytes, ts=None):
+        self.record(FRAME, jpeg_bytes, ts)
+
+    def record_line(self, line, ts=None):
+        """
+        Store ESP32 lines worth replaying, anything else is ignored.
+        """
+        if line.startswith("Ultra"):
+            self.record(ULTRA, line, ts)
+        elif line.startswith("Emerg,"):  # not "EmergEnd,"
+            self.record(EMERGENCY, line, ts)
+
+    def record_plan(self, lane_order, lane_times, counts=None, ts=None, replan=False):
+        self.record(PLAN, json.dumps({"order": list(lane_order), "times": list(lane_times),
+                                      "counts": list(counts) if counts is not None else None,
+                                      "replan": replan}), ts)
+        self.flush()  # a plan ends a cycle, a crash or Ctrl+C loses at most the cycle in progress
+
+    def flush(self):
+        with self._lock:
+            self._chunk.flush()
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            self._chunk.close()
+            self._index.close()
+
+
+class Replayer:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported recording version {self.meta.get('version')}")
+
+        index_path = os.path.join(path, "index.bin")
+        count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize  # ignore a half-written last record
+        self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r", shape=(count,)) if count else \
+            np.zeros(0, dtype=INDEX_DTYPE)
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def _chunk(self, chunk_id):
+        chunk = self._chunks.get(chunk_id)
+        if chunk is None:
+            with open(os.path.join(self.path, f"chunk_{chunk_id:05d}.bin"), "rb") as f:
+                chunk = self._chunks[chunk_id] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return chunk
+
+    def payload(self, i):
+        """
+        Payload bytes of record i, None if the chunk was cut short (e.g. by a power loss).
+        """
+        entry = self.index[i]
+        offset, length = int(entry["offset"]), int(entry["length"])
+        if length == 0:
+            return b""
+        try:
+            data = self._chunk(int(entry["chunk"]))[offset:offset + length]
+        except (OSError, ValueError):
+            return None
+        return data if len(data) == length else None
+
+    def events(self, kinds=None, start=None, end=None):
+        """
+        Yield (ts, kind, payload) in recording order, optionally filtered.
+        """
+        ts = self.index["ts"]
+        lo = int(np.searchsorted(ts, start)) if start is not None else 0
+        hi = int(np.searchsorted(ts, end, side="right")) if end is not None else len(ts)
+        selected = np.arange(lo, hi)
+        if kinds is not None:
+            selected = selected[np.isin(self.index["kind"][lo:hi], list(kinds))]
+        for i in selected:
+            data = self.payload(i)
+            if data is not None:
+                yield float(ts[i]), int(self.index["kind"][i]), data
+
+    def summary(self):
+        kinds, counts = np.unique(self.index["kind"], return_counts=True)
+        span = float(self.index["ts"][-1] - self.index["ts"][0]) if len(self.index) else 0.0
+        return {"records": len(self.index), "seconds": span,
+                "by_kind": {KIND_NAMES.get(int(k), str(k)): int(c) for k, c in zip(kinds, counts)}}
+
+    def close(self):
+        for chunk in self._chunks.values():
+            chunk.close()
+        self._chunks.clear()
+
+
+def replay(path, lanes, speed=0.0, on_plan=None):
+    """
+    Feed a recording through ai_module and the decision logic.
+    speed=0 runs as fast as possible, otherwise as a multiple of real time.
+    Every recorded cycle plan is recomputed from the latest replayed counts and
+    ultrasonic line, every emergency replan with remaining_plan from the
+    preceding Emerg line and the plan it cut short; on_plan(recorded, recomputed)
+    sees both.
+    """
+    import ai_module
+    from preprocess import Letterboxer
+    from traffic_logic import make_plan, parse_emergency_line, parse_ultrasonic_line, remaining_plan
+
+    ai_module.set_headless(True)
+    replayer = Replayer(path)
+    letterboxer = Letterboxer(buffers=1)
+    counts, ultra = None, None
+    running, emergency = None, None  # recorded plan the ESP32 runs, (lane, phase) of the last Emerg line
+    stats = {"frames": 0, "plans": 0, "replans": 0, "skipped_replans": 0, "different_plans": 0}
+    first_ts, started = None, time.monotonic()
+
+    for ts, kind, payload in replayer.events():
+        if speed and first_ts is not None:
+            delay = (ts - first_ts) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        first_ts = ts if first_ts is None else first_ts
+
+        if kind == FRAME:
+            frame, layout = letterboxer.decode(payload)
+            result, boxes = ai_module.detect_lane_boxes(frame, lanes)
+            counts = ai_module.get_lane_counts(boxes, lanes)
+            stats["frames"] += 1
+        elif kind == ULTRA:
+            ultra = parse_ultrasonic_line(bytes(payload).decode())
+        elif kind == EMERGENCY:
+            line = bytes(payload).decode()
+            if not line.startswith("Emerg,"):
+                continue  # EmergEnd lines in recordings made before record_line told them apart
+            lane, phase, _ = parse_emergency_line(line)
+            emergency = (lane, phase)
+        elif kind == PLAN:
+            recorded = json.loads(bytes(payload))
+            if recorded.get("replan"):
+                replan = None
+                if running is not None and emergency is not None:
+                    plan_counts = recorded["counts"] or running["counts"]
+                    replan = remaining_plan(plan_counts, running["order"], running["times"], emergency[1], emergency[0])
+                running, emergency = recorded, None
+                if replan is None:
+                    stats["skipped_replans"] += 1  # recording started mid-cycle or lost the Emerg line
+                    continue
+                lane_order, lane_times = replan
+                stats["replans"] += 1
+            else:
+                lane_order, lane_times, plan_counts = make_plan(counts if counts is not None else [0] * len(lanes), ultra)
+                running = recorded
+                stats["plans"] += 1
+            recomputed = {"order": lane_order, "times": lane_times, "counts": plan_counts,
+                          "replan": bool(recorded.get("replan"))}
+            if recorded["order"] != lane_order or recorded["times"] != lane_times:
+                stats["different_plans"] += 1
+            if on_plan is not None:
+                on_plan(recorded, recomputed)
+
+    stats["wall_seconds"] = time.monotonic() - started
+    replayer.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recording through the perception and decision code")
+    parser.add_argument("path")
+    parser.add_argument("--lanes", default="lanes.json", help="lane file (.json or old .npy)")
+    parser.add_argument("--speed", type=float, default=0.0, help="0 = as fast as possible")
+    parser.add_argument("--summary", action="store_true", help="only print what the recording contains")
+    args = parser.parse_args()
+
+    if args.summary:
+        print(json.dumps(Replayer(args.path).summary(), indent=2))
+        return
+
+    from lane_config import read_lanes
+
+    lanes = read_lanes(args.lanes)
+    if lanes is None:
+        parser.error(f"no lanes in {args.lanes}")
+
+    def show(recorded, recomputed):
+        if recorded["order"] != recomputed["order"] or recorded["times"] != recomputed["times"]:
+            label = "replan" if recomputed["replan"] else "plan"
+            print(f"{label} changed: recorded {recorded['order']} {recorded['times']} -> "
+                  f"now {recomputed['order']} {recomputed['times']}")
+
+    print(json.dumps(replay(args.path, lanes, args.speed, on_plan=show), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import struct
+import threading
+import time
+
+# Plan frame sent to the ESP32 in a single write:
+#   0xA5 | version | payload length | payload | CRC-16 (big endian)
+#   payload = seq | lane count n | order[n] | durations[n] (uint16 big endian, seconds)
+# The CRC (CCITT-FALSE) covers version, length and payload.
+# The ESP32 replies with a text line "Ack,<seq>" or "Nack,<seq>,<reason>".
+
+FRAME_START = 0xA5
+PROTOCOL_VERSION = 1
+MAX_LANES = 8
+
+def _make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+_CRC_TABLE = _make_crc_table()
+
+def crc16_ccitt(data, crc=0xFFFF):
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+def encode_plan(lane_order, lane_times, seq):
+    n = len(lane_order)
+    if n != len(lane_times) or not 0 < n <= MAX_LANES:
+        raise ValueError(f"plan needs 1..{MAX_LANES} lanes with one duration each")
+    payload = struct.pack(f">BB{n}B{n}H", seq & 0xFF, n, *lane_order, *[int(t) for t in lane_times])
+    body = struct.pack(">BB", PROTOCOL_VERSION, len(payload)) + payload
+    return bytes([FRAME_START]) + body + struct.pack(">H", crc16_ccitt(body))
+
+def decode_plan(frame):
+    """
+    Inverse of encode_plan. Returns (seq, lane_order, lane_times).
+    Raises ValueError on a malformed frame or bad CRC.
+    """
+    if len(frame) < 5 or frame[0] != FRAME_START:
+        raise ValueError("missing frame start")
+    version, length = frame[1], frame[2]
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"unsupported version {version}")
+    if len(frame) != 3 + length + 2:
+        raise ValueError("bad length")
+    body = frame[1:3 + length]
+    (crc,) = struct.unpack(">H", frame[3 + length:])
+    if crc16_ccitt(body) != crc:
+        raise ValueError("bad crc")
+    seq, n = frame[3], frame[4]
+    if length != 2 + 3 * n:
+        raise ValueError("bad lane count")
+    values = struct.unpack(f">{n}B{n}H", frame[5:3 + length])
+    return seq, list(values[:n]), list(values[n:])
+
+def parse_reply(line):
+    """
+    "Ack,7" -> ("Ack", 7), "Nack,7,crc" -> ("Nack", 7), anything else -> None
+    """
+    parts = line.strip().split(',')
+    if len(parts) >= 2 and parts[0] in ("Ack", "Nack"):
+        try:
+            return parts[0], int(parts[1])
+        except ValueError:
+            return parts[0], -1
+    return None
+
+class PlanSender:
+    """
+    Sends plan frames and matches Ack/Nack replies by sequence number.
+    send() blocks for one round trip; write() + handle_reply() let an
+    event loop that already reads the port do the same without blocking.
+    With a serial_reader.SensorState, send() waits for replies in the store
+    instead of reading the port itself.
+    """
+
+    def __init__(self, ser, reply_timeout=0.5, retries=2, on_line=None, state=None):
+        self.ser = ser
+        self.reply_timeout = reply_timeout
+        self.retries = retries
+        self.on_line = on_line  # receives unrelated lines read while waiting for a reply
+        self.state = state      # SensorState filled by a SerialReader, None -> read ser directly
+        self.seq = 0
+        self.pending = None     # (seq, frame, attempts) of the unacknowledged plan
+        self._seen = 0          # newest store reading already handled
+        self._send_lock = threading.Lock()  # the cycle and the emergency replan may both send()
+
+    def write(self, lane_order, lane_times):
+        self.seq = (self.seq + 1) & 0xFF
+        frame = encode_plan(lane_order, lane_times, self.seq)
+        if self.state is not None:
+            self._seen = self.state.seq  # replies stored before this write are not for this plan
+        self.ser.write(frame)
+        self.pending = (self.seq, frame, 1)
+        return self.seq
+
+    def handle_reply(self, line):
+        """
+        Returns "ack", "retry", "failed" or None if the line is not a reply to the pending plan.
+        """
+        reply = parse_reply(line)
+        if reply is None or self.pending is None:
+            return None
+        kind, seq = reply
+        pending_seq, frame, attempts = self.pending
+        if kind == "Ack" and seq == pending_seq:
+            self.pending = None
+            return "ack"
+        if kind == "Nack" and seq not in (pending_seq, -1):
+            return None  # late reply to an earlier plan, -1 is a frame cut short before its seq
+        if kind == "Nack" and line.strip().endswith(",busy"):
+            # outside the ESP32's plan window, resending cannot help
+            print(f"plan {pending_seq} refused, ESP32 is running a cycle")
+            self.pending = None
+            return "failed"
+        if kind == "Nack":
+            return self.retransmit()
+        return None
+
+    def retransmit(self):
+        if self.pending is None:
+            return None
+        pending_seq, frame, attempts = self.pending
+        if attempts > self.retries:
+            print(f"plan {pending_seq} not acknowledged after {attempts} attempts")
+            self.pending = None
+            return "failed"
+        self.ser.write(frame)
+        self.pending = (pending_seq, frame, attempts + 1)
+        return "retry"
+
+    def _read_reply(self, deadline):
+        if self.state is None:
+            return self.ser.readline().decode(errors="ignore").strip()
+        reading = self.state.wait_for(("Ack", "Nack"), self._seen, max(0.0, deadline - time.monotonic()))
+        if reading is None:
+            return ""
+        self._seen = reading.seq
+        return reading.line
+
+    def send(self, lane_order, lane_times):
+        with self._send_lock:
+            return self._send(lane_order, lane_times)
+
+    def _send(self, lane_order, lane_times):
+        self.write(lane_order, lane_times)
+        deadline = time.monotonic() + self.reply_timeout
+        while True:
+            line = self._read_reply(deadline)
+            status = self.handle_reply(line) if line else None
+            if status == "ack":
+                return True
+            if status == "failed":
+                return False
+            if status is None and line and self.on_line is not None:
+                self.on_line(line)
+
+            if status == "retry":
+                deadline = time.monotonic() + self.reply_timeout
+            elif time.monotonic() > deadline:
+                if self.retransmit() == "failed":
+                    return False
+                deadline = time.monotonic() + self.reply_timeout
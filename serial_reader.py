@@ -0,0 +1,139 @@
+"""
+One background thread owns every read from the ESP32 port.
+
+Each line is parsed by kind ("Ready", "Ultra", "Ack", ...) and stored in a
+SensorState as the newest reading of that kind, with the time it arrived and
+a sequence number. The decision loop and PlanSender read from the store
+instead of calling ser.readline() themselves, so no two readers race for
+the port and no line is lost between cycles.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from serial_protocol import parse_reply
+from traffic_logic import parse_emergency_line, parse_ultrasonic_line
+
+Reading = namedtuple("Reading", "seq ts kind line value")
+
+
+def _parse_fields(line):
+    return line.split(',')[1:]
+
+
+# kind -> parser(line) giving Reading.value; lines of other kinds keep value=None
+PARSERS = {
+    "Ultra": parse_ultrasonic_line,
+    "Ack": parse_reply,
+    "Nack": parse_reply,
+    "Emerg": parse_emergency_line,
+    "EmergEnd": _parse_fields,
+}
+
+
+def line_kind(line):
+    """
+    "Ultra,L1,1,..." -> "Ultra", "ESP32 Ready" -> "Ready", "Ack,3" -> "Ack"
+    """
+    if "Ready" in line:
+        return "Ready"
+    return line.split(',', 1)[0].strip()
+
+
+class SensorState:
+    """
+    Newest reading per line kind, safe to read from any thread.
+    """
+
+    def __init__(self):
+        self._changed = threading.Condition()
+        self._latest = {}
+        self.seq = 0
+
+    def update(self, line, ts=None):
+        kind = line_kind(line)
+        parser = PARSERS.get(kind)
+        try:
+            value = parser(line) if parser is not None else None
+        except (ValueError, IndexError) as e:
+            print(f"ESP line skipped -> {line!r}\n{e}")
+            return None
+        with self._changed:
+            self.seq += 1
+            reading = Reading(self.seq, time.time() if ts is None else ts, kind, line, value)
+            self._latest[kind] = reading
+            self._changed.notify_all()
+        return reading
+
+    def latest(self, kind, max_age=None):
+        """
+        Newest reading of kind, None if there is none or it is older than max_age seconds.
+        """
+        with self._changed:
+            reading = self._latest.get(kind)
+        if reading is None or (max_age is not None and time.time() - reading.ts > max_age):
+            return None
+        return reading
+
+    def wait_for(self, kinds, after_seq=0, timeout=None):
+        """
+        Block until a reading of one of kinds newer than after_seq exists and
+        return the newest one, or None after timeout seconds.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._changed:
+            while True:
+                found = [self._latest[kind] for kind in kinds
+                         if kind in self._latest and self._latest[kind].seq > after_seq]
+                if found:
+                    return max(found, key=lambda reading: reading.seq)
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+
+class SerialReader:
+    """
+    Reads lines from ser on a daemon thread and feeds them to a SensorState.
+    priority {kind: handler(reading)} runs first for urgent kinds such as "Emerg",
+    handlers must hand the work off and return quickly.
+    on_line(line) sees every line (printing, GUI); recorder keeps the ones worth replaying.
+    """
+
+    def __init__(self, ser, state=None, on_line=None, recorder=None, priority=None):
+        self.ser = ser
+        self.state = state if state is not None else SensorState()
+        self.on_line = on_line
+        self.recorder = recorder
+        self.priority = priority or {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="serial-reader")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                raw = self.ser.readline()
+            except Exception as e:  # port unplugged / closed, keep trying like the firmware does
+                print(f"Exception occurred while reading the serial port\n{e}")
+                time.sleep(1)
+                continue
+            line = raw.decode(errors="ignore").strip()
+            if not line:
+                continue
+            reading = self.state.update(line)
+            handler = self.priority.get(reading.kind) if reading is not None else None
+            if handler is not None:
+                handler(reading)
+            if self.recorder is not None:
+                self.recorder.record_line(line)
+            if self.on_line is not None:
+                self.on_line(line)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
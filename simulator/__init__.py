@@ -0,0 +1,11 @@
+"""
+Local stand-ins for the intersection hardware.
+
+VirtualESP32 -> pty-backed copy of the ESP_Code.ino state machine
+CameraServer -> serves /shot.jpg from a folder of recorded frames
+"""
+
+from simulator.camera_server import CameraServer
+from simulator.virtual_esp32 import VirtualESP32
+
+__all__ = ["CameraServer", "VirtualESP32"]
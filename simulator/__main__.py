@@ -0,0 +1,48 @@
+import argparse
+import json
+import time
+
+from simulator.camera_server import CameraServer
+from simulator.virtual_esp32 import VirtualESP32
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a virtual ESP32 and camera for the traffic controller")
+    parser.add_argument("--frames", help="folder of recorded .jpg frames served at /shot.jpg")
+    parser.add_argument("--camera-port", type=int, default=8080)
+    parser.add_argument("--speed", type=float, default=10.0, help="firmware time acceleration factor")
+    parser.add_argument("--fps", type=float, help="advance camera frames with time instead of per request")
+    parser.add_argument("--ultra-prob", type=float, default=0.2)
+    parser.add_argument("--emergency-prob", type=float, default=0.0)
+    parser.add_argument("--duration", type=float, help="stop after this many seconds and print stats")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    camera = None
+    if args.frames:
+        camera = CameraServer(args.frames, port=args.camera_port, fps=args.fps, speed=args.speed).start()
+        print(f"Camera serving {len(camera.frames)} frames at http://{camera.host}:{camera.port}/shot.jpg")
+
+    esp = VirtualESP32(speed=args.speed, ultra_prob=args.ultra_prob,
+                       emergency_prob=args.emergency_prob, seed=args.seed).start()
+    print(f"Virtual ESP32 on {esp.port}")
+    print(f"Run the controller with: ESP32_PORT={esp.port}"
+          + (f" CAMERA_IP={camera.host} CAMERA_PORT={camera.port}" if camera else ""))
+
+    try:
+        if args.duration:
+            time.sleep(args.duration)
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        esp.stop()
+        if camera is not None:
+            camera.stop()
+        print(json.dumps(esp.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import glob
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class CameraServer:
+    """
+    Serves recorded JPEG frames at /shot.jpg like the IP Webcam app.
+    With fps set, the frame advances with (accelerated) time,
+    otherwise every request gets the next frame.
+    """
+
+    def __init__(self, frames_dir, host="127.0.0.1", port=8080, fps=None, speed=1.0):
+        paths = sorted(glob.glob(os.path.join(frames_dir, "*.jpg")) + glob.glob(os.path.join(frames_dir, "*.jpeg")))
+        if not paths:
+            raise ValueError(f"no .jpg frames found in {frames_dir}")
+        self.frames = []
+        for path in paths:  # keep everything in memory so serving costs no disk I/O
+            with open(path, "rb") as f:
+                self.frames.append(f.read())
+
+        self.fps = fps
+        self.speed = speed
+        self.requests = 0
+        self._index = 0
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/shot.jpg":
+                    self.send_error(404)
+                    return
+                data = server.next_frame()
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # keep the console for the controller output
+
+        Handler.protocol_version = "HTTP/1.1"  # keep-alive, like the real camera
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = None
+
+    def next_frame(self):
+        with self._lock:
+            self.requests += 1
+            if self.fps:
+                index = int((time.monotonic() - self._started) * self.fps * self.speed)
+            else:
+                index = self._index
+                self._index += 1
+        return self.frames[index % len(self.frames)]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
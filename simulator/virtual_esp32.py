@@ -0,0 +1,295 @@
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+import numpy as np
+
+from serial_protocol import FRAME_START, decode_plan
+
+class VirtualESP32:
+    """
+    Reproduces the ESP_Code.ino loop() on a pseudo terminal.
+    The controller opens `port` (e.g. /dev/pts/5) like a real serial port.
+    All firmware delays are divided by `speed`.
+    """
+
+    def __init__(self, speed=1.0, ultra_prob=0.2, emergency_prob=0.0, seed=None,
+                 yellow_duration=2, emergency_duration=10, plan_timeout=5.0, cycle_pause=10.0, replan_timeout=1.0):
+        self.speed = speed
+        self.ultra_prob = ultra_prob            # chance a lane's ultrasonic sensor reports a car
+        self.emergency_prob = emergency_prob    # chance of an IR emergency at each phase check
+        self.yellow_duration = yellow_duration
+        self.emergency_duration = emergency_duration
+        self.plan_timeout = plan_timeout
+        self.cycle_pause = cycle_pause          # delay(10000) at the end of loop()
+        self.replan_timeout = replan_timeout    # wait for the remaining-lanes plan after an emergency
+        self.random = random.Random(seed)
+
+        self.lane_times = [1, 1, 1, 1]
+        self.lane_order = [0, 0, 0, 0]
+        self.plan_received = False
+        self.accepting_plan = False   # only in the Ready window or the post-emergency replan window
+        self.refused_plans = 0
+        self._last_accepted = None  # frame of the last applied plan
+        self._pending_emergency = None
+        self._emergency_at = None
+        self._emergency_reported = None   # time "Emerg" was pushed for the pending emergency
+        self.current_phase = 4
+        self.plan_time = None
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._rx = bytearray()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # latency measurements (seconds of wall-clock time)
+        self.plan_latencies = []    # "Ready" written -> plan received
+        self.cycle_times = []       # "Ready" -> next "Ready"
+        self.missed_plans = 0
+        self.cycles = 0
+        self.phases = []            # (lane, seconds) as run, for inspection
+        self.preemptions = []       # "Emerg" written -> remaining plan received
+
+    # --- timing -----------------------------------------------------------
+
+    def _delay(self, seconds):
+        self._stop.wait(seconds / self.speed)
+
+    def _wait_phase(self, seconds, interruptible=True):
+        """
+        waitPhase() in the firmware: keeps reading plan frames, False as soon as an emergency is pending.
+        """
+        deadline = time.monotonic() + seconds / self.speed
+        while not self._stop.is_set():
+            if self._pending_emergency is not None and interruptible:
+                if self._emergency_reported is None:
+                    self.report_emergency(self._pending_emergency)  # before the yellow, like the firmware
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._read_available(min(remaining, 0.01))
+            self.check_serial_input()
+        return True
+
+    def _wait_for_plan(self, seconds):
+        deadline = time.monotonic() + seconds / self.speed
+        while not self.plan_received and not self._stop.is_set():
+            self.check_serial_input()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.plan_received:
+                self._read_available(min(remaining, 0.01))
+        return self.plan_received
+
+    # --- serial I/O -------------------------------------------------------
+
+    def println(self, line):
+        os.write(self._master, (line + "\r\n").encode())
+
+    def _read_available(self, timeout):
+        ready, _, _ = select.select([self._master], [], [], timeout)
+        if ready:
+            try:
+                self._rx.extend(os.read(self._master, 1024))
+            except OSError:
+                pass
+
+    def check_serial_input(self):
+        """
+        Consume whatever complete frames or text lines are buffered.
+        """
+        while self._rx:
+            if self._rx[0] == FRAME_START:
+                if len(self._rx) < 3:
+                    return
+                total = 3 + self._rx[2] + 2
+                if len(self._rx) < total:
+                    return
+                frame = bytes(self._rx[:total])
+                del self._rx[:total]
+                self._handle_frame(frame)
+                continue
+
+            end = self._rx.find(b"\n")
+            if end < 0:
+                return
+            line = self._rx[:end].decode(errors="ignore").strip()
+            del self._rx[:end + 1]
+            self._handle_text(line)
+
+    def _handle_frame(self, frame):
+        try:
+            seq, order, times = decode_plan(frame)
+        except ValueError as e:
+            self.println(f"Nack,{frame[3] if len(frame) > 3 else -1},{e}")
+            return
+        if len(order) != 4 or any(lane >= 4 for lane in order):
+            self.println(f"Nack,{seq},lanes")
+            return
+        if frame == self._last_accepted:
+            # retransmit after a lost Ack, the plan is already applied
+            self.println(f"Ack,{seq}")
+            return
+        if not self.accepting_plan:
+            # late cycle plan: the lanes are running, keep the current plan
+            self.refused_plans += 1
+            self.println(f"Nack,{seq},busy")
+            return
+        self.lane_order = order
+        self.lane_times = times
+        self.plan_received = True
+        self.accepting_plan = False
+        self._last_accepted = frame
+        self.plan_time = time.monotonic()
+        self.println(f"Ack,{seq}")
+
+    def _handle_text(self, line):
+        # legacy Times,/Order, lines
+        if not self.accepting_plan:
+            return
+        if line.startswith("Times,"):
+            values = [int(v) for v in line[6:].split(",")[:4] if v]
+            self.lane_times[:len(values)] = values
+        elif line.startswith("Order,"):
+            values = [int(v) for v in line[6:].split(",")[:4] if v]
+            self.lane_order[:len(values)] = values
+            self.plan_received = True
+            self.accepting_plan = False
+
+    # --- firmware behaviour -----------------------------------------------
+
+    def trigger_emergency(self, lane):
+        """
+        Simulate an IR sensor seeing an emergency vehicle on `lane` (0-3), like the IR interrupt.
+        """
+        if self._pending_emergency is None:
+            self._emergency_at = time.monotonic()
+            self._pending_emergency = lane
+
+    def read_all_ultrasonics(self):
+        values = [1 if self.random.random() < self.ultra_prob else 0 for _ in range(4)]
+        self._delay(4 * 10 * 0.005)  # 10 samples per sensor
+        self.println("Ultra," + ",".join(f"L{i + 1},{v}" for i, v in enumerate(values)))
+        self._delay(0.5)
+
+    def ldr_loop(self):
+        self._delay(10 * 0.005 + 0.5)
+
+    def emergency_lane(self, poll=True):
+        if poll and self._pending_emergency is None and self.random.random() < self.emergency_prob:
+            self.trigger_emergency(self.random.randrange(4))
+        lane, self._pending_emergency = self._pending_emergency, None
+        return lane
+
+    def handle_single_lane(self, lane, duration, interruptible=True):
+        self.phases.append((lane, duration))
+        completed = self._wait_phase(duration, interruptible)
+        self._wait_phase(self.yellow_duration, interruptible=False)
+        return completed
+
+    def report_emergency(self, lane):
+        self._emergency_reported = time.monotonic()
+        self.plan_received = False  # Python answers with a plan for the remaining lanes
+        self.accepting_plan = self.current_phase < 4
+        self.println(f"Emerg,{lane},{self.current_phase},{int((self._emergency_reported - self._emergency_at) * 1000)}")
+
+    def handle_emergency_if_detected(self, poll=True):
+        lane = self.emergency_lane(poll)
+        if lane is None:
+            return False
+        if self._emergency_reported is None:
+            self.report_emergency(lane)
+        sent, self._emergency_reported = self._emergency_reported, None
+        self.handle_single_lane(lane, self.emergency_duration, interruptible=False)  # a new edge waits for it
+        self.println(f"EmergEnd,{lane}")
+        if self.current_phase < 4 and self._wait_for_plan(self.replan_timeout):
+            self.preemptions.append(self.plan_time - sent)
+        self.accepting_plan = False
+        return True
+
+    def loop_once(self, last_ready=None):
+        ready_time = time.monotonic()
+        if last_ready is not None:
+            self.cycle_times.append(ready_time - last_ready)
+        self.cycles += 1
+        self.plan_received = False
+        self.accepting_plan = True
+        self.println("Ready")
+        self._delay(0.1)
+
+        self.read_all_ultrasonics()
+
+        # wait for a plan, like the firmware's bounded wait window
+        if self._wait_for_plan(0.1 + 0.7 + self.plan_timeout - (time.monotonic() - ready_time) * self.speed):
+            self.plan_latencies.append(time.monotonic() - ready_time)
+        else:
+            self.missed_plans += 1
+        self.accepting_plan = False  # a late plan must not reorder lanes while they run
+
+        self.ldr_loop()
+        replanned = False
+        i = 0
+        while i < 4 and not self._stop.is_set():
+            self.current_phase = i
+            self.ldr_loop()
+            if self.handle_emergency_if_detected(poll=True):
+                if not self.plan_received:
+                    break
+                replanned, i = True, 0  # run the remaining lanes Python sent
+                continue
+            lane = self.lane_order[i]
+            if replanned and self.lane_times[lane] <= 0:
+                i += 1
+                continue
+            if not self.handle_single_lane(lane, self.lane_times[lane]):
+                self.handle_emergency_if_detected(poll=False)
+                if not self.plan_received:
+                    break
+                replanned, i = True, 0
+                continue
+            i += 1
+        self.current_phase = 4
+        if not self._wait_phase(self.cycle_pause):
+            self.handle_emergency_if_detected(poll=False)
+        return ready_time
+
+    def _run(self):
+        last_ready = None
+        while not self._stop.is_set():
+            last_ready = self.loop_once(last_ready)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def stats(self):
+        def summary(values):
+            if not values:
+                return None
+            arr = np.array(values) * 1000
+            return {"count": len(arr), "mean_ms": float(arr.mean()), "p50_ms": float(np.percentile(arr, 50)),
+                    "p95_ms": float(np.percentile(arr, 95)), "max_ms": float(arr.max())}
+
+        return {
+            "cycles": self.cycles,
+            "missed_plans": self.missed_plans,
+            "refused_plans": self.refused_plans,
+            "ready_to_plan": summary(self.plan_latencies),
+            "emerg_to_replan": summary(self.preemptions),
+            "cycle_time": summary(self.cycle_times),
+        }
@@ -0,0 +1,54 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+
+class SnapshotSink:
+    """
+    Saves annotated inference results as JPEG snapshots on a writer thread.
+    Only every Nth result is queued and a full queue drops the result,
+    so the decision path never waits on drawing or disk.
+    """
+
+    def __init__(self, out_dir="snapshots", every_n=10, max_queue=4, jpeg_quality=80):
+        self.out_dir = out_dir
+        self.every_n = max(1, every_n)
+        self.jpeg_quality = jpeg_quality
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._count = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        os.makedirs(out_dir, exist_ok=True)
+        self._thread.start()
+
+    def submit(self, result):
+        self._count += 1
+        if self._count % self.every_n != 0:
+            return False
+        try:
+            self.queue.put_nowait((time.time(), result))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self):
+        self.queue.put(None)  # blocking here is fine, it is only used at shutdown
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            timestamp, result = item
+            try:
+                annotated = result.plot()  # drawing happens here, off the hot path
+                name = time.strftime("%Y%m%d_%H%M%S", time.localtime(timestamp))
+                path = os.path.join(self.out_dir, f"{name}_{int(timestamp * 1000) % 1000:03d}.jpg")
+                cv2.imwrite(path, annotated, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            except Exception as e:
+                print(f"snapshot skipped -> exception occurred\n{e}")
@@ -0,0 +1,69 @@
+import threading
+
+from inference_governor import InferenceGovernor
+
+LEVELS = [{"name": "full", "imgsz": 640}, {"name": "small", "imgsz": 320}, {"name": "skip", "imgsz": 320, "skip": 1}]
+
+
+def governor(**options):
+    options.setdefault("levels", LEVELS)
+    return InferenceGovernor(deadline=1.0, window=4, patience=3, **options)
+
+
+def test_steps_down_when_close_to_the_deadline():
+    g = governor()
+    g.record(0.5)
+    assert g.level == 0
+    g.record(0.95)
+    assert g.level == 1 and g.imgsz == 320
+
+
+def test_steps_back_up_after_patience():
+    g = governor()
+    g.record(2.0)
+    for _ in range(2):
+        g.record(0.1)
+    assert g.level == 1
+    g.record(0.1)
+    assert g.level == 0
+
+
+def test_skip_level_reuses_every_other_frame():
+    g = governor()
+    g.level = 2
+    assert not g.should_skip()  # nothing to reuse yet
+    g.record(0.1, [1, 2, 3, 4])
+    assert [g.should_skip() for _ in range(4)] == [True, False, True, False]
+
+
+def test_weights_level_waits_until_loaded():
+    release = threading.Event()
+
+    def load(weights):
+        release.wait(5)
+        return f"model:{weights}"
+
+    g = governor(levels=[{"name": "full"}, {"name": "light", "weights": "light.pt"}], load_model=load)
+    g.record(2.0)  # starts the background preload instead of switching
+    assert g.level == 0 and g.model_for_level("default") == "default"
+
+    release.set()
+    g._loader.join(5)
+    g.record(2.0)
+    assert g.level == 1 and g.model_for_level("default") == "model:light.pt"
+
+
+def test_preload_in_foreground():
+    g = governor(levels=[{"name": "full"}, {"name": "light", "weights": "light.pt"}], load_model=lambda w: w)
+    assert g.preload(background=False) is None
+    assert g.loaded(1)
+
+
+def test_failed_load_keeps_the_current_level():
+    def fail(weights):
+        raise OSError("missing")
+
+    g = governor(levels=[{"name": "full"}, {"name": "light", "weights": "light.pt"}], load_model=fail)
+    g.preload(background=False)
+    g.record(2.0)
+    assert g.level == 0
@@ -0,0 +1,98 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from lane_config import FORMAT_VERSION, LaneStore, get_store, load_lanes, save_lanes
+
+SQUARE = [[0, 0], [10, 0], [10, 10], [0, 10]]
+TRIANGLE = [[20, 20], [40, 20], [30, 40]]
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def lane_file(tmp_path):
+    path = str(tmp_path / "lanes.json")
+    save_lanes([SQUARE, TRIANGLE], path, camera_id="cam")
+    return path
+
+
+def test_save_load_round_trip(lane_file):
+    lanes, meta = load_lanes(lane_file)
+    assert [lane.tolist() for lane in lanes] == [SQUARE, TRIANGLE]
+    assert meta == {"version": FORMAT_VERSION, "camera_id": "cam", "size": [640, 640]}
+    assert not os.path.exists(lane_file + ".tmp")
+
+
+def test_missing_file(tmp_path):
+    store = LaneStore(str(tmp_path / "lanes.json"), legacy_path=None)
+    assert not store.exists()
+    assert store.get() is None
+
+
+def test_cached_until_the_file_changes(lane_file):
+    store = LaneStore(lane_file, legacy_path=None, check_interval=0)
+    lanes = store.get()
+    assert store.get() is lanes
+    assert store.reloads == 1
+
+    save_lanes([TRIANGLE], lane_file)
+    bump_mtime(lane_file)
+    reloaded = store.get()
+    assert [lane.tolist() for lane in reloaded] == [TRIANGLE]
+    assert store.reloads == 2
+
+
+def test_check_interval_skips_stat(lane_file):
+    store = LaneStore(lane_file, legacy_path=None, check_interval=60)
+    lanes = store.get()
+    save_lanes([TRIANGLE], lane_file)
+    bump_mtime(lane_file)
+    assert store.get() is lanes
+
+
+def test_bad_file_keeps_previous_lanes(lane_file):
+    store = LaneStore(lane_file, legacy_path=None, check_interval=0)
+    lanes = store.get()
+    with open(lane_file, "w") as f:
+        json.dump({"version": 99, "lanes": []}, f)
+    bump_mtime(lane_file)
+    assert store.get() is lanes
+
+
+def test_save_is_picked_up_immediately(lane_file):
+    store = LaneStore(lane_file, legacy_path=None, check_interval=60)
+    store.get()
+    assert [lane.tolist() for lane in store.save([TRIANGLE])] == [TRIANGLE]
+
+
+def test_legacy_npy_is_migrated(tmp_path):
+    legacy = str(tmp_path / "lanes.npy")
+    ragged = np.empty(2, dtype=object)
+    ragged[0], ragged[1] = np.array(SQUARE), np.array(TRIANGLE)
+    np.save(legacy, ragged, allow_pickle=True)
+
+    store = LaneStore(str(tmp_path / "lanes.json"), legacy_path=legacy)
+    assert [lane.tolist() for lane in store.get()] == [SQUARE, TRIANGLE]
+    assert os.path.exists(tmp_path / "lanes.json")
+
+
+def test_get_store_is_shared_per_path(tmp_path):
+    path = str(tmp_path / "shared.json")
+    assert get_store(path, legacy_path=None) is get_store(path)
+
+
+def test_get_store_fills_in_options_left_unset(tmp_path):
+    path = str(tmp_path / "later.json")
+    store = get_store(path)
+    assert get_store(path, camera_id="10.0.0.2:8080") is store
+    assert store.camera_id == "10.0.0.2:8080"
+    store.save([SQUARE])
+    assert load_lanes(path)[1]["camera_id"] == "10.0.0.2:8080"
+    with pytest.raises(ValueError):
+        get_store(path, camera_id="10.0.0.3:8080")
@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+import pytest
+
+from ai_module import Detections, build_lane_mask, get_lane_counts, lane_labels
+
+
+def reference_labels(centers, lanes):
+    # the per-box pointPolygonTest loop get_lane_counts replaced
+    polys = [np.asarray(lane, dtype=np.float32).reshape((-1, 1, 2)) for lane in lanes]
+    labels = []
+    for x, y in centers:
+        labels.append(next((i + 1 for i, poly in enumerate(polys)
+                            if cv2.pointPolygonTest(poly, (float(x), float(y)), False) >= 0), 0))
+    return np.array(labels)
+
+
+def random_lanes(rng, count=4):
+    return [cv2.convexHull(rng.integers(0, 641, (6, 2)).astype(np.int32)).reshape(-1, 2) for _ in range(count)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_labels_match_point_polygon_test(seed):
+    rng = np.random.default_rng(seed)
+    lanes = random_lanes(rng)
+    vertices = np.concatenate(lanes)
+    centers = np.concatenate([
+        rng.uniform(-8, 648, (3000, 2)),                             # anywhere, also past the frame border
+        rng.integers(0, 640, (3000, 2)),                             # whole pixels
+        np.repeat(vertices, 40, axis=0) + rng.uniform(-1.5, 1.5, (len(vertices) * 40, 2)),  # near corners
+    ]).astype(np.float32)
+    assert (lane_labels(centers, lanes) == reference_labels(centers, lanes)).all()
+
+
+def test_points_on_edges_and_frame_border():
+    lanes = [np.array([[0, 0], [639, 0], [639, 320], [0, 320]]), np.array([[100, 100], [300, 100], [200, 600]])]
+    centers = np.array([[0, 0], [639.4, 320.4], [639.6, 10], [200, 320], [200, 320.6], [150, 100], [200, 600]],
+                       dtype=np.float32)
+    assert lane_labels(centers, lanes).tolist() == reference_labels(centers, lanes).tolist()
+
+
+def test_lowest_lane_wins_overlaps():
+    square = np.array([[0, 0], [100, 0], [100, 100], [0, 100]])
+    mask = build_lane_mask([square, square])
+    assert mask[50, 50] == 1
+    assert get_lane_counts([(50, 50), (150, 150)], [square, square]) == [1, 0]
+
+
+def test_counts_and_class_weights():
+    lanes = [np.array([[0, 0], [320, 0], [320, 640], [0, 640]]), np.array([[321, 0], [639, 0], [639, 639], [321, 639]])]
+    centers = np.array([[10, 10], [20, 20], [400, 400]], dtype=np.float32)
+    boxes = Detections(centers, np.ones((3, 2), dtype=np.float32), np.ones(3, dtype=np.float32), np.array([2, 5, 5]))
+    assert get_lane_counts(boxes, lanes, weights={}) == [2, 1]
+    assert get_lane_counts(boxes, lanes, weights={5: 2.5}) == [4, 2]  # 3.5 -> 4, 2.5 -> 2 (round half to even)
+    assert get_lane_counts(None, lanes) == [0, 0]
+    assert get_lane_counts([], None) == []
@@ -0,0 +1,67 @@
+import numpy as np
+
+from motion_gate import MotionGate
+
+LANE = [np.array([[0, 0], [319, 0], [319, 639], [0, 639]])]  # left half of the frame
+
+
+def frame(value=100):
+    return np.full((640, 640, 3), value, dtype=np.uint8)
+
+
+def inferred(gate, image, payload=None, lanes=LANE):
+    result = gate.should_infer(image, payload, lanes)
+    if result:
+        gate.update([1])
+    return result
+
+
+def test_first_frame_and_missing_frame_infer():
+    gate = MotionGate()
+    assert gate.should_infer(None)
+    assert inferred(gate, frame(), b"a")
+
+
+def test_same_jpeg_is_skipped():
+    gate = MotionGate()
+    inferred(gate, frame(), b"a")
+    assert not inferred(gate, frame(200), b"a")  # identical payload wins, no pixel check
+    assert gate.stats()["skipped"] == 1
+
+
+def test_static_scene_with_new_jpeg_is_skipped():
+    gate = MotionGate()
+    inferred(gate, frame(), b"a")
+    noisy = frame()
+    noisy[::7, ::7] += 5  # sensor noise below pixel_threshold
+    assert not inferred(gate, noisy, b"b")
+
+
+def test_change_inside_a_lane_infers():
+    gate = MotionGate()
+    inferred(gate, frame(), b"a")
+    moved = frame()
+    moved[200:300, 100:200] = 255
+    assert inferred(gate, moved, b"b")
+
+
+def test_change_outside_the_lanes_is_ignored():
+    gate = MotionGate()
+    inferred(gate, frame(), b"a")
+    moved = frame()
+    moved[:, 400:] = 255
+    assert not inferred(gate, moved, b"b")
+    assert inferred(gate, moved, b"c", lanes=None)  # without lanes the whole frame counts
+
+
+def test_slow_drift_is_compared_with_the_last_inferred_frame():
+    gate = MotionGate(pixel_threshold=25)
+    inferred(gate, frame(100), b"a")
+    assert not inferred(gate, frame(115), b"b")
+    assert inferred(gate, frame(130), b"c")  # 30 levels away from the reference, not 15
+
+
+def test_force_interval():
+    gate = MotionGate(force_interval=0.0)
+    inferred(gate, frame(), b"a")
+    assert inferred(gate, frame(), b"a")
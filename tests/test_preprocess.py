@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+import pytest
+
+from frame_grabber import FrameGrabber
+from preprocess import Letterboxer, jpeg_size, to_source_coords
+
+
+def jpeg(w, h, value=200, progressive=False):
+    image = np.full((h, w, 3), value, dtype=np.uint8)
+    params = [cv2.IMWRITE_JPEG_PROGRESSIVE, 1] if progressive else []
+    ok, data = cv2.imencode(".jpg", image, params)
+    assert ok
+    return data.tobytes()
+
+
+@pytest.mark.parametrize("size", [(640, 480), (1280, 720), (17, 33), (4000, 3000)])
+def test_jpeg_size_reads_the_header(size):
+    assert jpeg_size(jpeg(*size)) == size
+
+
+def test_jpeg_size_progressive():
+    assert jpeg_size(jpeg(800, 600, progressive=True)) == (800, 600)
+
+
+@pytest.mark.parametrize("data", [b"", b"\x89PNG\r\n", b"\xff\xd8\xff\xe0\x00\x10", jpeg(64, 64)[:20]])
+def test_jpeg_size_rejects_garbage(data):
+    assert jpeg_size(data) is None
+
+
+def test_layout_fits_and_centers():
+    layout = Letterboxer().layout(1280, 720)
+    assert (layout.new_w, layout.new_h) == (640, 360)
+    assert (layout.left, layout.top) == (0, 140)
+    assert layout.reduce == 2  # a 1/2 decode still covers 640x360
+
+
+@pytest.mark.parametrize("size", [(1280, 720), (480, 640), (640, 640), (320, 200)])
+def test_decode_matches_resize_and_pad(size):
+    data = jpeg(*size)
+    frame, layout = Letterboxer().decode(data)
+    assert frame.shape == (640, 640, 3)
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    expected = np.zeros((640, 640, 3), dtype=np.uint8)
+    expected[layout.top:layout.top + layout.new_h, layout.left:layout.left + layout.new_w] = \
+        cv2.resize(image, (layout.new_w, layout.new_h))
+    # reduced JPEG decoding differs from full decode + resize by a few levels at most
+    assert np.abs(frame.astype(int) - expected).max() <= 8
+
+
+def test_padding_repainted_when_the_layout_changes():
+    letterboxer = Letterboxer(buffers=1)
+    letterboxer.decode(jpeg(640, 640, value=255))
+    frame, layout = letterboxer.decode(jpeg(1280, 720, value=255))
+    assert frame[:layout.top].max() == 0 and frame[layout.top + layout.new_h:].max() == 0
+
+
+def test_caller_canvas_is_painted_before_first_use():
+    out = np.full((640, 640, 3), 77, dtype=np.uint8)
+    frame, layout = Letterboxer().decode(jpeg(1280, 720), out=out)
+    assert frame is out
+    assert out[0, 0].tolist() == [0, 0, 0]
+
+
+def test_to_source_coords():
+    layout = Letterboxer().layout(1280, 720)
+    assert to_source_coords([(320, 320)], layout).tolist() == [[640.0, 360.0]]
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+
+def grabber():
+    data = jpeg(1280, 720)
+    grabber = FrameGrabber("camera", 8080, letterboxer=Letterboxer(buffers=1))
+    grabber.session.get = lambda *args, **kwargs: FakeResponse(data)
+    return grabber, data
+
+
+def shot(grabber, data):
+    grabber._publish(grabber._fetch(), data)
+
+
+def test_grabber_reuses_frames_nobody_took():
+    g, data = grabber()
+    seen = set()
+    for _ in range(10):
+        shot(g, data)
+        seen.add(id(g._frame))
+    assert len(seen) == 2
+
+
+def test_grabber_never_writes_to_a_handed_out_frame():
+    g, data = grabber()
+    shot(g, data)
+    frame, payload, timestamp, stale = g.snapshot()
+    assert payload == data and not stale
+    frame[...] = 1  # marker the grabber must not overwrite
+    for _ in range(5):
+        shot(g, data)
+    assert frame.max() == 1 and g.latest()[0] is not frame
@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+from lane_config import to_polygons
+from recorder import EMERGENCY, FRAME, PLAN, ULTRA, Recorder, Replayer, replay
+from traffic_logic import make_plan, remaining_plan
+
+LANES = to_polygons([[[0, 0], [10, 0], [10, 10]]] * 4)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "recording")
+
+
+def test_round_trip(path):
+    recorder = Recorder(path, camera_id="cam")
+    recorder.record_frame(b"\xff\xd8jpeg", ts=1.0)
+    recorder.record_line("Ultra,L1,1,L2,0,L3,0,L4,0", ts=2.0)
+    recorder.record_line("Emerg,2,1,3", ts=3.0)
+    recorder.record_line("EmergEnd,2", ts=3.5)  # not worth replaying
+    recorder.record_line("Ready", ts=3.6)
+    recorder.record_plan([0, 1, 2, 3], [4, 2, 2, 2], [2, 1, 1, 1], ts=4.0)
+
+    replayer = Replayer(path)
+    events = list(replayer.events())
+    assert [kind for _, kind, _ in events] == [FRAME, ULTRA, EMERGENCY, PLAN]
+    assert [ts for ts, _, _ in events] == [1.0, 2.0, 3.0, 4.0]
+    assert bytes(events[0][2]) == b"\xff\xd8jpeg"
+    assert json.loads(bytes(events[3][2])) == {"order": [0, 1, 2, 3], "times": [4, 2, 2, 2],
+                                               "counts": [2, 1, 1, 1], "replan": False}
+    assert replayer.summary()["by_kind"] == {"frame": 1, "ultra": 1, "emergency": 1, "plan": 1}
+    replayer.close()
+
+
+def test_plans_are_on_disk_without_close(path):
+    recorder = Recorder(path)
+    recorder.record_line("Ultra,L1,1,L2,0,L3,0,L4,0")
+    recorder.record_plan([0, 1, 2, 3], [2, 2, 2, 2])
+    assert len(Replayer(path)) == 2
+
+
+def test_filters_and_time_range(path):
+    recorder = Recorder(path)
+    for ts in range(5):
+        recorder.record_line("Ultra,L1,0,L2,0,L3,0,L4,0", ts=float(ts))
+        recorder.record_frame(b"x", ts=ts + 0.5)
+    recorder.flush()
+    replayer = Replayer(path)
+    assert [ts for ts, _, _ in replayer.events(kinds=[ULTRA], start=1.0, end=3.0)] == [1.0, 2.0, 3.0]
+
+
+def test_chunks_roll_over_and_recording_continues(path):
+    recorder = Recorder(path, chunk_size=10)
+    for i in range(3):
+        recorder.record_frame(bytes([i]) * 8)
+    recorder.close()
+    Recorder(path, chunk_size=10).record_frame(b"last")
+    replayer = Replayer(path)
+    assert [bytes(data) for _, _, data in replayer.events()] == [b"\x00" * 8, b"\x01" * 8, b"\x02" * 8, b"last"]
+    assert replayer.index["chunk"].tolist() == [0, 1, 2, 3]  # the reopened chunk 2 had no room left
+
+
+def test_half_written_index_record_is_ignored(path):
+    recorder = Recorder(path)
+    recorder.record_frame(b"one")
+    recorder.close()
+    with open(f"{path}/index.bin", "ab") as f:
+        f.write(b"\x00" * 5)
+    assert len(Replayer(path)) == 1
+
+
+def test_replay_recomputes_cycle_plans_and_replans(path):
+    recorder = Recorder(path)
+    recorder.record_line("Ultra,L1,1,L2,1,L3,0,L4,1")
+    order, times, counts = make_plan([0, 0, 0, 0], [1, 1, 0, 1])
+    recorder.record_plan(order, times, counts)
+    recorder.record_line("Emerg,2,1,3")
+    replan = remaining_plan(counts, order, times, 1, 2)
+    recorder.record_plan(*replan, counts, replan=True)
+    recorder.record_plan(*replan, counts, replan=True)  # no Emerg line before it
+
+    seen = []
+    stats = replay(path, LANES, on_plan=lambda recorded, recomputed: seen.append(recomputed))
+    assert stats["plans"] == 1 and stats["replans"] == 1 and stats["skipped_replans"] == 1
+    assert stats["different_plans"] == 0
+    assert [item["replan"] for item in seen] == [False, True]
+    assert (seen[1]["order"], seen[1]["times"]) == tuple(replan)
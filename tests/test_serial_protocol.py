@@ -0,0 +1,139 @@
+import random
+import time
+
+import pytest
+
+from serial_protocol import FRAME_START, PROTOCOL_VERSION, PlanSender, crc16_ccitt, decode_plan, encode_plan
+
+
+def crc16_bitwise(data):
+    # crc16Ccitt() in ESP_Code.ino
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+            crc &= 0xFFFF
+    return crc
+
+
+class FakeSerial:
+    """
+    Records written frames and hands out scripted reply lines, one per readline().
+    """
+
+    def __init__(self, replies=()):
+        self.writes = []
+        self.replies = list(replies)
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+
+    def readline(self):
+        if self.replies:
+            return (self.replies.pop(0) + "\n").encode()
+        time.sleep(0.001)
+        return b""
+
+
+def test_crc_check_value():
+    assert crc16_ccitt(b"123456789") == 0x29B1  # CRC-16/CCITT-FALSE
+
+
+def test_crc_matches_firmware():
+    rng = random.Random(0)
+    for length in range(0, 40):
+        data = bytes(rng.randrange(256) for _ in range(length))
+        assert crc16_ccitt(data) == crc16_bitwise(data)
+
+
+def test_round_trip():
+    frame = encode_plan([2, 0, 3, 1], [8, 4, 0, 6], seq=7)
+    assert frame[0] == FRAME_START and frame[1] == PROTOCOL_VERSION
+    assert decode_plan(frame) == (7, [2, 0, 3, 1], [8, 4, 0, 6])
+
+
+def test_round_trip_long_durations_and_seq_wrap():
+    assert decode_plan(encode_plan([0], [65535], seq=256)) == (0, [0], [65535])
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda f: f[:-1] + bytes([f[-1] ^ 1]),  # crc
+    lambda f: f[:6] + bytes([f[6] ^ 1]) + f[7:],  # payload
+    lambda f: bytes([0x00]) + f[1:],  # start byte
+    lambda f: f[:1] + bytes([9]) + f[2:],  # version
+    lambda f: f[:-2],  # truncated
+])
+def test_decode_rejects_corrupt_frames(corrupt):
+    with pytest.raises(ValueError):
+        decode_plan(corrupt(encode_plan([0, 1, 2, 3], [2, 2, 2, 2], seq=1)))
+
+
+def test_encode_rejects_bad_plans():
+    with pytest.raises(ValueError):
+        encode_plan([0, 1], [2], seq=1)
+    with pytest.raises(ValueError):
+        encode_plan([], [], seq=1)
+
+
+def test_send_acked():
+    ser = FakeSerial(["Ack,1"])
+    assert PlanSender(ser, reply_timeout=0.05).send([0, 1, 2, 3], [2, 2, 2, 2])
+    assert len(ser.writes) == 1
+
+
+def test_nack_retransmits_same_frame():
+    ser = FakeSerial(["Nack,1,crc", "Ack,1"])
+    assert PlanSender(ser, reply_timeout=0.05).send([0, 1, 2, 3], [2, 2, 2, 2])
+    assert len(ser.writes) == 2 and ser.writes[0] == ser.writes[1]
+
+
+def test_busy_nack_fails_without_retransmit():
+    ser = FakeSerial(["Nack,1,busy"])
+    sender = PlanSender(ser, reply_timeout=0.05)
+    assert not sender.send([0, 1, 2, 3], [2, 2, 2, 2])
+    assert len(ser.writes) == 1 and sender.pending is None
+
+
+def test_timeout_retries_then_fails():
+    ser = FakeSerial()
+    sender = PlanSender(ser, reply_timeout=0.01, retries=2)
+    assert not sender.send([0, 1, 2, 3], [2, 2, 2, 2])
+    assert len(ser.writes) == 3 and sender.pending is None
+
+
+def test_stale_ack_is_not_taken_for_the_pending_plan():
+    ser = FakeSerial(["Ack,9", "Ack,1"])
+    lines = []
+    assert PlanSender(ser, reply_timeout=0.05, on_line=lines.append).send([0, 1, 2, 3], [2, 2, 2, 2])
+    assert lines == ["Ack,9"]
+
+
+def test_handle_reply_state_machine():
+    sender = PlanSender(FakeSerial(), retries=1)
+    assert sender.handle_reply("Ack,1") is None  # nothing pending
+    seq = sender.write([0, 1, 2, 3], [2, 2, 2, 2])
+    assert sender.handle_reply("Ultra,L1,0,L2,0,L3,0,L4,0") is None
+    assert sender.handle_reply(f"Nack,{seq},len") == "retry"
+    assert sender.handle_reply(f"Nack,{seq},len") == "failed"
+    assert sender.pending is None
+    seq = sender.write([0, 1, 2, 3], [2, 2, 2, 2])
+    assert sender.handle_reply(f"Ack,{seq}") == "ack"
+    assert sender.pending is None
+
+
+def test_nack_for_an_earlier_plan_is_ignored():
+    sender = PlanSender(FakeSerial())
+    sender.write([0, 1, 2, 3], [2, 2, 2, 2])
+    seq = sender.write([3, 2, 1, 0], [2, 2, 2, 2])
+    assert sender.handle_reply(f"Nack,{seq - 1},busy") is None
+    assert sender.handle_reply(f"Nack,{seq - 1},crc") is None
+    assert sender.pending[0] == seq
+
+
+def test_nack_without_seq_retransmits():
+    ser = FakeSerial()
+    sender = PlanSender(ser)
+    sender.write([0, 1, 2, 3], [2, 2, 2, 2])
+    assert sender.handle_reply("Nack,-1,header") == "retry"
+    assert len(ser.writes) == 2
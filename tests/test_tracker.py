@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from tracker import LaneTracker
+
+# two lanes side by side: x < 320 is lane 1, x >= 320 lane 2
+LANES = [np.array([[0, 0], [319, 0], [319, 639], [0, 639]]), np.array([[320, 0], [639, 0], [639, 639], [320, 639]])]
+
+
+def run(tracker, frames, start=0.0, step=1.0):
+    for i, centers in enumerate(frames):
+        tracker.update(centers, start + i * step)
+    return tracker
+
+
+def test_counts_confirmed_cars_per_lane():
+    tracker = run(LaneTracker(LANES, alpha=1.0), [[(100, 100), (100, 300), (500, 100)]] * 3)
+    assert tracker.counts() == [2, 1]
+
+
+def test_one_frame_false_positive_is_not_counted():
+    tracker = run(LaneTracker(LANES, alpha=1.0, min_hits=2), [[(100, 100)], [(100, 100), (500, 500)], [(100, 100)]])
+    assert tracker.counts() == [1, 0]
+    assert tracker.demand().arrival_rate[1] == 0
+
+
+def test_short_occlusion_is_bridged():
+    tracker = LaneTracker(LANES, alpha=1.0, max_missed=2)
+    run(tracker, [[(100, 100)]] * 3 + [[]] * 2)
+    assert tracker.counts() == [1, 0]
+    run(tracker, [[]], start=5)
+    assert tracker.counts() == [0, 0]
+
+
+def test_moving_car_keeps_its_track_and_changes_lane():
+    tracker = LaneTracker(LANES, alpha=1.0, max_distance=40, rate_window=100)
+    run(tracker, [[(250 + 30 * i, 200)] for i in range(5)])  # crosses x = 320 at the third frame
+    assert len(tracker.ids) == 1
+    assert tracker.counts() == [0, 1]
+    demand = tracker.demand()
+    assert demand.discharge_rate[0] > 0 and demand.arrival_rate[1] > 0
+
+
+def test_jump_beyond_max_distance_is_a_new_car():
+    tracker = run(LaneTracker(LANES, max_distance=40), [[(100, 100)], [(100, 200)]])
+    assert len(tracker.ids) == 2
+
+
+def test_queue_is_smoothed():
+    tracker = run(LaneTracker(LANES, alpha=0.5, min_hits=1, max_missed=1), [[(100, 100), (100, 300)], []])
+    assert tracker.demand().queue[0] == pytest.approx(2.0)  # occlusion bridge keeps both on the missed frame
+    run(tracker, [[]] * 4, start=2)
+    assert tracker.demand().queue[0] < 0.5
+
+
+def test_arrival_rate_and_lookahead():
+    tracker = LaneTracker(LANES, alpha=1.0, min_hits=1, rate_window=10)
+    frames = [[(100, 50 + 60 * j) for j in range(i + 1)] for i in range(5)]  # one new car per second
+    run(tracker, frames)
+    demand = tracker.demand()
+    assert demand.arrival_rate[0] == pytest.approx(5 / 4)
+    assert tracker.counts(lookahead=4) == [10, 0]
+
+
+def test_set_lanes_relabels_tracks_and_restarts_stats():
+    tracker = run(LaneTracker(LANES, alpha=1.0), [[(100, 100), (500, 100)]] * 3)
+    one_lane = [np.array([[0, 0], [639, 0], [639, 639], [0, 639]])]
+    tracker.set_lanes(one_lane)
+    assert tracker.num_lanes == 1 and tracker.last_update is None
+    tracker.update([(100, 100), (500, 100)], 10.0)
+    assert tracker.counts() == [2]
+
+
+def test_empty_tracker():
+    tracker = LaneTracker(LANES)
+    assert tracker.counts() == [0, 0]
+    assert tracker.update(None).queue == [0.0, 0.0]
@@ -0,0 +1,54 @@
+from traffic_logic import get_green_duration, parse_emergency_line, remaining_plan, sort_lanes_by_priority
+
+WEIGHTS = [1, 1, 1, 1]
+
+
+def test_served_and_emergency_lanes_go_last_with_zero_time():
+    counts = [4, 1, 3, 2]
+    # lanes 0 and 2 already ran, the emergency came on lane 3 during phase 2
+    order, times = remaining_plan(counts, [0, 2, 1, 3], [8, 2, 6, 4], phase=2, emergency_lane=3,
+                                  lane_weights=WEIGHTS)
+    assert order[0] == 1
+    assert sorted(order) == [0, 1, 2, 3]
+    assert times == [0, 2, 0, 0]
+
+
+def test_remaining_lanes_sorted_by_priority():
+    counts = [1, 5, 2, 4]
+    order, times = remaining_plan(counts, [0, 1, 2, 3], [2, 10, 4, 8], phase=0, emergency_lane=0,
+                                  lane_weights=WEIGHTS)
+    assert order[:3] == [1, 3, 2]
+    assert order[3] == 0
+    assert times == [0] + get_green_duration(counts)[1:]
+
+
+def test_lanes_skipped_by_an_earlier_replan_stay_served():
+    counts = [3, 3, 3, 3]
+    order, times = remaining_plan(counts, [1, 2, 0, 3], [0, 6, 6, 6], phase=0, emergency_lane=2,
+                                  lane_weights=WEIGHTS)
+    # lane_times is per lane: lane 0 got 0 s, the emergency lane 2 just ran
+    assert times == [0, 6, 0, 6]
+    assert set(order[:2]) == {1, 3}
+
+
+def test_nothing_left_to_serve():
+    assert remaining_plan([1, 1, 1, 1], [0, 1, 2, 3], [2, 2, 2, 2], phase=3, emergency_lane=3,
+                          lane_weights=WEIGHTS) is None
+
+
+def test_parse_emergency_line():
+    assert parse_emergency_line("Emerg,2,1,350") == (2, 1, 350)
+    assert parse_emergency_line("Emerg,0,3") == (0, 3, 0)  # older firmware sends no delay
+
+
+def test_replan_of_a_replan_uses_the_running_order():
+    counts = [2, 4, 6, 8]
+    # the running plan is itself a replan: lane 0 already ran, 3 and 2 remain
+    order, times = remaining_plan(counts, [3, 2, 1, 0], [0, 8, 12, 16], phase=1, emergency_lane=1,
+                                  lane_weights=WEIGHTS)
+    assert order[0] == 2
+    assert times == [0, 0, get_green_duration(counts)[2], 0]
+
+
+def test_weights_break_ties():
+    assert sort_lanes_by_priority([2, 2, 2, 2], [1, 1.2, 1, 1.2]) == [1, 3, 0, 2]
@@ -0,0 +1,198 @@
+"""
+Tracks cars across the frames seen between cycles and turns them into
+smoothed per-lane demand.
+
+A single snapshot count jumps whenever a car is missed or hidden behind a
+truck. LaneTracker matches box centers frame to frame (nearest centroid
+within max_distance, looked up in a grid so each frame costs O(boxes)),
+keeps a track alive for a few missed frames, and reports per lane
+    queue           exponentially smoothed number of tracked cars
+    arrival_rate    cars entering the lane per second
+    discharge_rate  cars leaving the lane per second
+over the last rate_window seconds.
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+from traffic_logic import demand_counts
+
+LaneDemand = namedtuple("LaneDemand", "queue arrival_rate discharge_rate")
+
+ARRIVAL = 0
+DISCHARGE = 1
+
+
+class LaneTracker:
+    def __init__(self, lanes, mask=None, max_distance=40.0, max_missed=3, min_hits=2, alpha=0.3, rate_window=60.0):
+        if mask is None:
+            from ai_module import get_lane_mask
+            mask = get_lane_mask(lanes)
+        self.mask = mask                  # lane label per pixel, 0 = no lane (see ai_module.build_lane_mask)
+        self.num_lanes = len(lanes)
+        self.max_distance = max_distance  # pixels a car may move between two frames
+        self.max_missed = max_missed      # frames a track survives without a matching box
+        self.min_hits = min_hits          # frames before a track counts, filters one-frame false positives
+        self.alpha = alpha                # weight of the newest frame in the smoothed queue
+        self.rate_window = rate_window
+
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.positions = np.zeros((0, 2), dtype=np.float32)
+        self.lanes = np.zeros(0, dtype=np.intp)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.missed = np.zeros(0, dtype=np.int32)
+
+        self.queue = np.zeros(self.num_lanes, dtype=np.float64)
+        self.frames = 0
+        self.last_update = None
+        self._started = None
+        self._events = deque()  # (ts, kind, lane) of arrivals and discharges
+
+    def _labels(self, centers):
+        h, w = self.mask.shape
+        xs = np.floor(centers[:, 0] + 0.5).astype(np.intp)
+        ys = np.floor(centers[:, 1] + 0.5).astype(np.intp)
+        inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+        labels = np.zeros(len(centers), dtype=np.intp)
+        labels[inside] = self.mask[ys[inside], xs[inside]]
+        return labels
+
+    def _match(self, centers):
+        """
+        Greedy nearest-track match per box using a grid of max_distance cells.
+        Returns the matched track index per box, -1 for new cars.
+        """
+        cell = self.max_distance
+        grid = {}
+        for i, (x, y) in enumerate(self.positions):
+            grid.setdefault((int(x // cell), int(y // cell)), []).append(i)
+
+        matches = np.full(len(centers), -1, dtype=np.intp)
+        claimed = np.zeros(len(self.positions), dtype=bool)
+        limit = self.max_distance ** 2
+        for j, (x, y) in enumerate(centers):
+            cx, cy = int(x // cell), int(y // cell)
+            best, best_d = -1, limit
+            for gx in (cx - 1, cx, cx + 1):
+                for gy in (cy - 1, cy, cy + 1):
+                    for i in grid.get((gx, gy), ()):
+                        if claimed[i]:
+                            continue
+                        dx, dy = self.positions[i, 0] - x, self.positions[i, 1] - y
+                        d = dx * dx + dy * dy
+                        if d < best_d:
+                            best, best_d = i, d
+            if best >= 0:
+                claimed[best] = True
+                matches[j] = best
+        return matches
+
+    def update(self, boxes, ts=None):
+        """
+        Feed the boxes of one frame (ai_module.Detections or a list of centers).
+        """
+        ts = time.time() if ts is None else ts
+        if boxes is None or len(boxes) == 0:
+            centers = np.zeros((0, 2), dtype=np.float32)
+        elif hasattr(boxes, "centers"):
+            centers = np.asarray(boxes.centers, dtype=np.float32)
+        else:
+            centers = np.asarray(boxes, dtype=np.float32).reshape(-1, 2)
+        labels = self._labels(centers)
+
+        with self._lock:
+            if self._started is None:
+                self._started = ts
+            matches = self._match(centers)
+            matched = matches >= 0
+            tracks = matches[matched]
+
+            # matched tracks: move, count hits and lane changes
+            was_confirmed = self.hits[tracks] >= self.min_hits
+            old_lanes = self.lanes[tracks]
+            new_lanes = labels[matched]
+            self.positions[tracks] = centers[matched]
+            self.hits[tracks] += 1
+            self.missed += 1
+            self.missed[tracks] = 0
+            self.lanes[tracks] = new_lanes
+            confirmed = self.hits[tracks] >= self.min_hits
+            changed = was_confirmed & (old_lanes != new_lanes)
+            self._add_events(ts, DISCHARGE, old_lanes[changed])
+            self._add_events(ts, ARRIVAL, new_lanes[changed | (confirmed & ~was_confirmed)])
+
+            # tracks lost for too long leave their lane
+            lost = self.missed > self.max_missed
+            self._add_events(ts, DISCHARGE, self.lanes[lost & (self.hits >= self.min_hits)])
+            keep = ~lost
+
+            # unmatched boxes start new tracks
+            fresh = centers[~matched]
+            fresh_ids = np.arange(self._next_id, self._next_id + len(fresh), dtype=np.int64)
+            self._next_id += len(fresh)
+            fresh_hits = np.ones(len(fresh), dtype=np.int32)
+            self._add_events(ts, ARRIVAL, labels[~matched][fresh_hits >= self.min_hits])
+
+            self.ids = np.concatenate([self.ids[keep], fresh_ids])
+            self.positions = np.concatenate([self.positions[keep], fresh])
+            self.lanes = np.concatenate([self.lanes[keep], labels[~matched]])
+            self.hits = np.concatenate([self.hits[keep], fresh_hits])
+            self.missed = np.concatenate([self.missed[keep], np.zeros(len(fresh), dtype=np.int32)])
+
+            # tracks missed for a frame or two still count, that is what bridges occlusions
+            counted = self.lanes[self.hits >= self.min_hits]
+            raw = np.bincount(counted, minlength=self.num_lanes + 1)[1:self.num_lanes + 1]
+            self.queue = raw if self.frames == 0 else self.alpha * raw + (1 - self.alpha) * self.queue
+            self.frames += 1
+            self.last_update = ts
+
+            while self._events and self._events[0][0] < ts - self.rate_window:
+                self._events.popleft()
+        return self.demand()
+
+    def set_lanes(self, lanes, mask=None):
+        """
+        Switch to edited lane polygons. Tracks keep their positions and are
+        relabeled, the smoothed queue and rates start over.
+        """
+        if mask is None:
+            from ai_module import get_lane_mask
+            mask = get_lane_mask(lanes)
+        with self._lock:
+            self.mask = mask
+            self.num_lanes = len(lanes)
+            self.lanes = self._labels(self.positions)
+            self.queue = np.zeros(self.num_lanes, dtype=np.float64)
+            self.frames = 0
+            self.last_update = None
+            self._started = None
+            self._events.clear()
+
+    def _add_events(self, ts, kind, lanes):
+        for lane in lanes[lanes > 0]:
+            self._events.append((ts, kind, int(lane)))
+
+    def demand(self):
+        with self._lock:
+            if self.last_update is None:
+                zeros = [0.0] * self.num_lanes
+                return LaneDemand(zeros, zeros, zeros)
+            span = max(1.0, min(self.rate_window, self.last_update - self._started))
+            events = np.array([(kind, lane) for _, kind, lane in self._events], dtype=np.intp).reshape(-1, 2)
+            rates = []
+            for kind in (ARRIVAL, DISCHARGE):
+                lanes = events[events[:, 0] == kind, 1]
+                rates.append((np.bincount(lanes, minlength=self.num_lanes + 1)[1:self.num_lanes + 1] / span).tolist())
+            return LaneDemand(self.queue.tolist(), rates[0], rates[1])
+
+    def counts(self, lookahead=0.0):
+        """
+        Whole-car lane counts for the decision logic, see traffic_logic.demand_counts.
+        """
+        queue, arrival_rate, discharge_rate = self.demand()
+        return demand_counts(queue, arrival_rate, lookahead)
@@ -0,0 +1,67 @@
+lane_weights = [1.2, 1, 1.2, 1]  # Weight of each lane (e.g., Lane 1: weight 1, Lane 2: weight 2, etc.)
+
+max_capacity = [2, 3, 2, 3]
+
+seconds_per_car = 2  # green time given for each car in a lane
+
+fixed_time_counts = [1, 1, 1, 1]  # used while the detector is loading, ultrasonic still raises busy lanes
+
+def parse_ultrasonic_line(line):
+    parts = line.split(',')
+    # Format: "Ultra,L1,1,L2,0,L3,0,L4,1"
+    values = [int(parts[i + 1]) for i in range(1, len(parts), 2)]
+    return values
+
+def parse_emergency_line(line):
+    # Format: "Emerg,<lane 0-3>,<phase index>,<ms since the IR edge>"
+    parts = line.split(',')
+    return int(parts[1]), int(parts[2]), int(parts[3]) if len(parts) > 3 else 0
+
+# If ultrasonic status is 1 (indicating a car), set the lane count to max_capacity
+def apply_ultrasonic(car_counts, ultra_check, capacity=max_capacity):
+    for i in range(min(len(car_counts), len(ultra_check))):
+        if ultra_check[i] == 1:
+            car_counts[i] = capacity[i]
+    return car_counts
+
+# Function to sort lanes based on their priority
+def sort_lanes_by_priority(car_counts, lane_weights=lane_weights):
+    lane_priorities = [(i, car_counts[i] * lane_weights[i]) for i in range(len(car_counts))]
+
+    # Sort lanes by priority (highest priority first)
+    lane_priorities.sort(key=lambda x: x[1], reverse=True)
+    return [lane[0] for lane in lane_priorities]
+
+#Function to calculate the green duration for each lane
+def get_green_duration(car_counts):
+    return [seconds_per_car * c for c in car_counts]
+
+# Plan for the rest of a cycle the ESP32 cut short at `phase` for an emergency vehicle.
+# Lanes already served (and the emergency lane) go last with 0 s, which the ESP32 skips
+# after a replan; None when nothing is left to serve.
+def remaining_plan(car_counts, lane_order, lane_times, phase, emergency_lane, lane_weights=lane_weights):
+    served = {emergency_lane}
+    served.update(lane_order[:phase])
+    served.update(lane for lane in range(len(lane_times)) if lane_times[lane] <= 0)
+    if len(served) >= len(car_counts):
+        return None
+    priority = sort_lanes_by_priority(car_counts, lane_weights)
+    order = [lane for lane in priority if lane not in served] + [lane for lane in priority if lane in served]
+    durations = [0 if lane in served else d for lane, d in enumerate(get_green_duration(car_counts))]
+    return order, durations
+
+def demand_counts(queue, arrival_rates, lookahead=0.0):
+    """
+    Whole cars to serve per lane: the smoothed queue plus the cars expected
+    to arrive within lookahead seconds (tracker.LaneTracker output).
+    """
+    return [int(round(q + r * lookahead)) for q, r in zip(queue, arrival_rates)]
+
+def make_plan(car_counts, ultra_check=None, weights=lane_weights, capacity=max_capacity):
+    """
+    Full decision step: ultrasonic override, lane order and green durations.
+    """
+    counts = list(car_counts)
+    if ultra_check:
+        apply_ultrasonic(counts, ultra_check, capacity)
+    return sort_lanes_by_priority(counts, weights), get_green_duration(counts), counts
@@ -0,0 +1,217 @@
+"""
+Vectorized queueing simulator for comparing signal timing policies offline.
+
+Every array has shape (intersections, lanes), so thousands of intersections
+are stepped together with NumPy. Vehicles arrive per lane as a Poisson process
+and discharge at a fixed saturation flow while their lane is green. The cycle
+follows the firmware: each planned lane gets green + yellow, then the ESP32
+spends `lost_time` seconds before printing the next "Ready".
+
+    python traffic_sim.py --intersections 2000 --hours 2
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from traffic_logic import lane_weights, max_capacity, seconds_per_car
+
+
+class SimConfig:
+    def __init__(self, num_lanes=4, dt=1.0, saturation_flow=1.0 / seconds_per_car, yellow=2.0, lost_time=13.0,
+                 camera_limit=15, ultra_queue=1, miss_rate=0.05, rate_smoothing=0.2):
+        self.num_lanes = num_lanes
+        self.dt = dt                            # seconds per simulation step
+        self.saturation_flow = saturation_flow  # vehicles per second leaving a green lane
+        self.yellow = yellow                    # seconds of yellow after every planned lane
+        self.lost_time = lost_time              # firmware overhead per cycle (LDR reads, ultrasonics, delay(10000))
+        self.camera_limit = camera_limit        # cars visible to the camera per lane
+        self.ultra_queue = ultra_queue          # queue length that trips the ultrasonic sensor
+        self.miss_rate = miss_rate              # chance the detector misses a visible car
+        self.rate_smoothing = rate_smoothing    # EWMA factor for the per-cycle arrival rate estimate
+
+
+# --- policies ----------------------------------------------------------------
+# A policy takes the observed state of a batch of intersections and returns
+# (order, green, active): lane order (ints), green seconds and which lanes run.
+
+def current_policy(state, config):
+    """
+    The deployed logic: ultrasonic override, counts * lane_weights priority, 2 s per car.
+    """
+    counts = np.where(state["ultra"], np.asarray(max_capacity)[:config.num_lanes], state["counts"])
+    priority = counts * np.asarray(lane_weights)[:config.num_lanes]
+    order = np.argsort(-priority, axis=1, kind="stable")  # same tie-break as list.sort(reverse=True)
+    green = seconds_per_car * counts.astype(np.float64)
+    return order, green, np.ones_like(green, dtype=bool)
+
+
+def webster_policy(state, config, min_cycle=30.0, max_cycle=120.0, min_green=4.0):
+    """
+    Webster optimal cycle with green split by flow ratio, fixed lane order.
+    """
+    n = config.num_lanes
+    y = np.clip(state["arrival_rate"] / config.saturation_flow, 0.0, None)
+    Y = np.clip(y.sum(axis=1, keepdims=True), 1e-6, 0.95)
+    lost = n * config.yellow + config.lost_time
+    cycle = np.clip((1.5 * lost + 5.0) / (1.0 - Y), min_cycle, max_cycle)
+    green = np.maximum(min_green, (cycle - lost) * y / Y)
+    order = np.broadcast_to(np.arange(n), green.shape).copy()
+    return order, green, np.ones_like(green, dtype=bool)
+
+
+def max_pressure_policy(state, config, slot=12.0, max_lanes=2):
+    """
+    Serve only the highest pressure lanes each cycle. With no downstream
+    queue information the pressure of a lane is its observed queue.
+    """
+    pressure = state["counts"] + state["ultra"] * 0.5
+    order = np.argsort(-pressure, axis=1, kind="stable")
+    rank = np.argsort(order, axis=1)
+    active = (rank < max_lanes) & (pressure > 0)
+    active[np.arange(len(active)), order[:, 0]] = True  # always serve at least one lane
+    green = np.where(active, np.minimum(slot, np.maximum(seconds_per_car, seconds_per_car * state["counts"])), 0.0)
+    return order, green, active
+
+
+POLICIES = {
+    "current": current_policy,
+    "webster": webster_policy,
+    "max_pressure": max_pressure_policy,
+}
+
+
+# --- simulation ----------------------------------------------------------------
+
+def _schedule(order, green, active, config):
+    """
+    Per-lane green start time within the cycle and the cycle length.
+    """
+    phase = np.where(active, green + config.yellow, 0.0)
+    phase_in_order = np.take_along_axis(phase, order, axis=1)
+    start_in_order = np.cumsum(phase_in_order, axis=1) - phase_in_order
+    start = np.empty_like(start_in_order)
+    np.put_along_axis(start, order, start_in_order, axis=1)
+    return start, phase.sum(axis=1) + config.lost_time
+
+
+def simulate(policy, arrival_rates, duration, config=None, seed=0):
+    """
+    arrival_rates -> (intersections, lanes) vehicles per second.
+    Returns average delay, queue length and throughput for the policy.
+    """
+    config = config or SimConfig(num_lanes=arrival_rates.shape[1])
+    arrival_rates = np.asarray(arrival_rates, dtype=np.float64)
+    B, L = arrival_rates.shape
+    arrivals_rng = np.random.default_rng(seed)       # same arrival stream for every policy
+    sensing_rng = np.random.default_rng(seed + 1)
+
+    queue = np.zeros((B, L), dtype=np.int64)
+    credit = np.zeros((B, L))
+    rate_estimate = np.zeros((B, L))
+    arrived_this_cycle = np.zeros((B, L))
+    clock = np.zeros(B)
+    cycle_len = np.zeros(B)  # 0 -> plan on the first step
+    start = np.zeros((B, L))
+    green = np.zeros((B, L))
+    active = np.zeros((B, L), dtype=bool)
+
+    queue_sum = 0.0
+    max_queue = 0
+    departed = 0
+    arrived = 0
+    cycles = 0
+
+    steps = int(duration / config.dt)
+    for _ in range(steps):
+        renew = clock >= cycle_len
+        if renew.any():
+            idx = np.flatnonzero(renew)
+            finished = cycle_len[idx] > 0
+            if finished.any():
+                measured = arrived_this_cycle[idx] / np.maximum(cycle_len[idx], config.dt)[:, None]
+                a = config.rate_smoothing
+                rate_estimate[idx] = np.where(finished[:, None], (1 - a) * rate_estimate[idx] + a * measured,
+                                              rate_estimate[idx])
+            arrived_this_cycle[idx] = 0
+
+            # what the controller sees at "Ready"
+            visible = np.minimum(queue[idx], config.camera_limit)
+            state = {
+                "counts": sensing_rng.binomial(visible, 1.0 - config.miss_rate),
+                "ultra": queue[idx] >= config.ultra_queue,
+                "arrival_rate": rate_estimate[idx],
+                "queue": queue[idx],
+            }
+            o, g, act = policy(state, config)
+            s, c = _schedule(o, g, act, config)
+            start[idx], green[idx], active[idx], cycle_len[idx] = s, g, act, c
+            clock[idx] = 0.0
+            cycles += len(idx)
+
+        new = arrivals_rng.poisson(arrival_rates * config.dt)
+        queue += new
+        arrived_this_cycle += new
+        arrived += int(new.sum())
+
+        t = clock[:, None]
+        is_green = active & (t >= start) & (t < start + green)
+        credit = np.where(is_green, credit + config.saturation_flow * config.dt, 0.0)
+        leave = np.minimum(queue, np.floor(credit).astype(np.int64))
+        credit -= leave
+        queue -= leave
+        departed += int(leave.sum())
+
+        queue_sum += queue.sum() * config.dt
+        max_queue = max(max_queue, int(queue.max()))
+        clock += config.dt
+
+    hours = steps * config.dt / 3600.0
+    return {
+        "avg_delay_s": queue_sum / max(arrived, 1),   # Little's law: vehicle-seconds queued / vehicles
+        "mean_queue": queue_sum / (steps * config.dt * B * L),
+        "max_queue": max_queue,
+        "veh_per_hour": departed / hours / B,
+        "served_fraction": departed / max(arrived, 1),
+        "avg_cycle_s": steps * config.dt * B / max(cycles, 1),
+    }
+
+
+def random_demand(intersections, num_lanes=4, low=0.02, high=0.15, seed=0):
+    """
+    Per-lane arrival rates (vehicles per second) drawn uniformly per intersection.
+    """
+    return np.random.default_rng(seed).uniform(low, high, size=(intersections, num_lanes))
+
+
+def compare_policies(arrival_rates, duration=3600.0, policies=None, config=None, seed=0):
+    results = {}
+    for name in policies or POLICIES:
+        started = time.perf_counter()
+        results[name] = simulate(POLICIES[name], arrival_rates, duration, config, seed)
+        results[name]["runtime_s"] = time.perf_counter() - started
+
+    print(f"{'policy':<14}{'delay s':>10}{'queue':>8}{'max q':>8}{'veh/h':>10}{'served':>8}{'cycle s':>9}{'run s':>8}")
+    for name, r in results.items():
+        print(f"{name:<14}{r['avg_delay_s']:>10.1f}{r['mean_queue']:>8.2f}{r['max_queue']:>8d}{r['veh_per_hour']:>10.0f}"
+              f"{r['served_fraction']:>8.2f}{r['avg_cycle_s']:>9.1f}{r['runtime_s']:>8.2f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare signal timing policies on simulated demand")
+    parser.add_argument("--intersections", type=int, default=1000)
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--low", type=float, default=0.02, help="min arrival rate per lane (veh/s)")
+    parser.add_argument("--high", type=float, default=0.15, help="max arrival rate per lane (veh/s)")
+    parser.add_argument("--policies", nargs="+", choices=list(POLICIES), default=list(POLICIES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rates = random_demand(args.intersections, low=args.low, high=args.high, seed=args.seed)
+    compare_policies(rates, duration=args.hours * 3600, policies=args.policies, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()